@@ -4,6 +4,7 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 import sys
+import math
 import torch
 from cachetools import TTLCache
 import os
@@ -15,7 +16,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "src"
 from env import Gongzhu
 from card import Card
 from declaration import Declaration
-from policy import RandomPolicy, GreedyPolicy, Policy, DMC, MFE
+from policy import RandomPolicy, GreedyPolicy, Policy, DMC, MFE, ISMCTSPolicy
 from player import Player
 
 DB_DIR = "data/record.db"
@@ -38,6 +39,15 @@ dmc_policy = load_policy(DMC, CHECKPOINT_DIR_DMC)
 # Other policies
 random_policy = RandomPolicy()
 greedy_policy = GreedyPolicy()
+# Search policies keep state between moves (simulation env, sampler and
+# generator), so every game gets its own. Their time per move, in
+# seconds, can be set per game with "search_time"
+DEFAULT_SEARCH_TIME = 1.0
+MIN_SEARCH_TIME = 0.05
+MAX_SEARCH_TIME = 5.0
+
+def make_ismcts_policy(search_time : float) -> ISMCTSPolicy:
+    return ISMCTSPolicy(time_budget=search_time, rollout_policy=greedy_policy)
 
 # A dictionary to store ongoing games
 # games = redis.Redis(host='localhost', port=6379, db=0)
@@ -63,6 +73,10 @@ ai_policies = {
     "MFE": mfe_policy,
 }
 
+search_policies = {
+    "ISMCTS": make_ismcts_policy,
+}
+
 app = Flask(__name__)
 CORS(app)
 
@@ -70,7 +84,21 @@ CORS(app)
 def start_game_route():
     # Get AI policy 
     data : dict = request.json
-    ai_policy : Policy = ai_policies[data.get('ai')]
+    ai = data.get('ai')
+    if ai in search_policies:
+        search_time = data.get('search_time')
+        if search_time is None:
+            search_time = DEFAULT_SEARCH_TIME
+        try:
+            search_time = float(search_time)
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Invalid search_time'}), 400
+        if not math.isfinite(search_time):
+            return jsonify({'message': 'Invalid search_time'}), 400
+        search_time = min(max(search_time, MIN_SEARCH_TIME), MAX_SEARCH_TIME)
+        ai_policy : Policy = search_policies[ai](search_time)
+    else:
+        ai_policy : Policy = ai_policies[ai]
     # if data.get('ai') == "DMC":
     #     checkpoint_state = torch.load(CHECKPOINT_DIR)
     #     ai_policy.load_state_dict(checkpoint_state)
@@ -0,0 +1,210 @@
+# Gongzhu environments stepped in parallel worker processes
+# Each worker owns one unmodified Gongzhu and writes its observations
+# into preallocated shared-memory arrays, so only actions, rewards and
+# flags go through the pipes. The interface follows gymnasium's
+# AsyncVectorEnv (step_async / step_wait).
+import multiprocessing as mp
+import traceback
+import numpy as np
+from typing import Callable, List, Sequence, Tuple
+from card import Card, CARDS, CARD_DTYPE, SUITE_SIZE
+from env import Gongzhu
+from player import Player
+from policy import RandomPolicy
+
+N_PLAYERS = 4
+MAX_ROUNDS = SUITE_SIZE // N_PLAYERS
+
+# Shape and dtype of each observation array of a single env
+OBSERVATION_SPECS = {
+    "agent_info": ((6, SUITE_SIZE), CARD_DTYPE),
+    "players_info": ((N_PLAYERS - 1, 6, SUITE_SIZE), CARD_DTYPE),
+    # Card values in playing order, -1 for cards not played yet
+    "history": ((SUITE_SIZE,), np.int8),
+    # First player of each round, -1 for rounds not started yet
+    "first_player_indices": ((MAX_ROUNDS,), np.int8),
+    "legal_mask": ((SUITE_SIZE,), CARD_DTYPE),
+    "scores": ((N_PLAYERS,), np.float64),
+}
+
+def random_players() -> List[Player]:
+    """Default players of a worker: the agent and three random opponents."""
+    return [Player(id=str(i), name=str(i), policy=RandomPolicy()) for i in range(N_PLAYERS)]
+
+def _create_shared_memory(ctx, num_envs : int) -> dict:
+    return {key: ctx.RawArray("B", num_envs * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            for key, (shape, dtype) in OBSERVATION_SPECS.items()}
+
+def _shared_arrays(shared_memory : dict, num_envs : int) -> dict:
+    return {key: np.frombuffer(shared_memory[key], dtype=dtype).reshape(num_envs, *shape)
+            for key, (shape, dtype) in OBSERVATION_SPECS.items()}
+
+def _write_observation(env : Gongzhu, arrays : dict, index : int) -> None:
+    # Read from the buffers of the env, which every observation mode
+    # (to_state, flat or headless) has
+    buffers = env.to_buffers()
+    arrays["agent_info"][index] = buffers["agent_info"]
+    arrays["players_info"][index] = buffers["players_info"]
+    history = arrays["history"][index]
+    history.fill(-1)
+    history_length = buffers["history_length"]
+    history[:history_length] = buffers["history"][:history_length].argmax(axis=1)
+    first_player_indices = arrays["first_player_indices"][index]
+    first_player_indices.fill(-1)
+    num_rounds = buffers["num_rounds"]
+    first_player_indices[:num_rounds] = buffers["first_player_indices"][:num_rounds]
+    arrays["legal_mask"][index] = np.asarray(env.agent_legal_moves()) \
+        if not env.is_end_episode() else 0
+    arrays["scores"][index] = buffers["scores"]
+
+def _worker(index : int, env_fn : Callable[[], Gongzhu], players_fn : Callable[[], List[Player]],
+            pipe, parent_pipe, shared_memory : dict, num_envs : int) -> None:
+    parent_pipe.close()
+    arrays = _shared_arrays(shared_memory, num_envs)
+    env = env_fn()
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == "reset":
+                _, info = env.reset(ai_players=players_fn(), seed=data)
+                _write_observation(env, arrays, index)
+                pipe.send(((info,), True))
+            elif command == "step":
+                action = data if isinstance(data, Card) else CARDS[int(data)]
+                state, reward, terminated, truncated, info = env.step(action)
+                if terminated or truncated:
+                    # Same-step autoreset, the terminal scores are kept in info
+                    # A fast_forward env already gives the settled ones
+                    info.setdefault("final_scores", state["scores"])
+                    env.reset(ai_players=players_fn())
+                _write_observation(env, arrays, index)
+                pipe.send(((reward, terminated, truncated, info), True))
+            elif command == "close":
+                pipe.send((None, True))
+                break
+            else:
+                raise RuntimeError(f"Unknown command {command}.")
+    except (KeyboardInterrupt, Exception):
+        pipe.send((traceback.format_exc(), False))
+    finally:
+        env.close()
+
+class AsyncGongzhu:
+    """
+    Gongzhu envs run in worker processes, stepped together.
+
+    The agent (player 0) of every env is controlled from the main process,
+    the other players are played inside the workers by the policies of
+    `players_fn`. Observations are numpy arrays over shared memory with a
+    leading env dimension: agent_info, players_info, history,
+    first_player_indices, legal_mask and scores, so a model can evaluate
+    all envs in one batch. Actions are card values or Cards.
+
+    Envs that end are reset within the same step, and their terminal
+    scores are found in infos["final_scores"].
+    """
+    def __init__(self, env_fns : Sequence[Callable[[], Gongzhu]],
+                 players_fn : Callable[[], List[Player]] = random_players,
+                 copy : bool = True, context : str = None):
+        """
+        :param env_fns: Functions creating the env of each worker.
+        :param players_fn: Called in a worker at every reset to create
+            its four players. Must be picklable.
+        :param copy: If False, observations are views of the shared
+            memory, overwritten by the next step.
+        :param context: Start method of the worker processes.
+        """
+        self.num_envs : int = len(env_fns)
+        self._copy : bool = copy
+        ctx = mp.get_context(context)
+        self._shared_memory = _create_shared_memory(ctx, self.num_envs)
+        self._observations = _shared_arrays(self._shared_memory, self.num_envs)
+
+        self._parent_pipes = []
+        self._processes = []
+        for index, env_fn in enumerate(env_fns):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker, name=f"Worker<AsyncGongzhu>-{index}", daemon=True,
+                args=(index, env_fn, players_fn, child_pipe, parent_pipe,
+                      self._shared_memory, self.num_envs))
+            self._parent_pipes.append(parent_pipe)
+            self._processes.append(process)
+            process.start()
+            child_pipe.close()
+        self._waiting : bool = False
+        # Workers that raised an error have exited
+        self._failed : set = set()
+        self.closed : bool = False
+
+    def _observation(self) -> dict:
+        if self._copy:
+            return {key: array.copy() for key, array in self._observations.items()}
+        return dict(self._observations)
+
+    def _receive(self) -> list:
+        results = []
+        errors = []
+        for index, pipe in self._live_pipes():
+            result, success = pipe.recv()
+            if success:
+                results.append(result)
+            else:
+                self._failed.add(index)
+                errors.append(f"Worker {index}:\n{result}")
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return results
+
+    def _live_pipes(self) -> list:
+        return [(index, pipe) for index, pipe in enumerate(self._parent_pipes)
+                if index not in self._failed]
+
+    def reset(self, seed : int = None, options : dict = None) -> Tuple[dict, dict]:
+        assert not self._waiting, "Calling reset while waiting for a pending step."
+        for index, pipe in enumerate(self._parent_pipes):
+            pipe.send(("reset", None if seed is None else seed + index))
+        infos = [info for info, in self._receive()]
+        return self._observation(), {"infos": infos}
+
+    def step_async(self, actions) -> None:
+        assert not self._waiting, "Calling step_async while waiting for a pending step."
+        for pipe, action in zip(self._parent_pipes, actions):
+            pipe.send(("step", action))
+        self._waiting = True
+
+    def step_wait(self) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray, dict]:
+        assert self._waiting, "Calling step_wait without any step_async."
+        self._waiting = False
+        rewards, terminations, truncations, infos = zip(*self._receive())
+        return (self._observation(),
+                np.array(rewards, dtype=np.float64),
+                np.array(terminations, dtype=bool),
+                np.array(truncations, dtype=bool),
+                {"infos": list(infos)})
+
+    def step(self, actions) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray, dict]:
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self._waiting:
+            try:
+                self._receive()
+            except RuntimeError:
+                pass
+            self._waiting = False
+        for _, pipe in self._live_pipes():
+            pipe.send(("close", None))
+        self._receive()
+        for pipe in self._parent_pipes:
+            pipe.close()
+        for process in self._processes:
+            process.join()
+        self.closed = True
+
+    def __del__(self):
+        if not getattr(self, "closed", True):
+            self.close()
@@ -5,6 +5,9 @@ import numpy as np
 from typing import List
 
 SUITE_SIZE = 52
+# Storage type of {0,1}^52 card vectors. Conversion to float happens
+# at the model input
+CARD_DTYPE = np.uint8
 SUITS = ["club", "diamond", "heart", "spade"]
 # RANKS = ["02", "03", "04", "05", "06", "07", "08", "09",
 #             "10", "11", "12", "13", "14"]
@@ -12,9 +15,28 @@ SUITS = ["club", "diamond", "heart", "spade"]
 RANKS = ["2", "3", "4", "5", "6", "7", "8", "9",
             "10", "Jack", "Queen", "King", "Ace"]
 
-def one_hot_vector(length, location) -> np.array:
+# Bitboard constants: card i occupies bit i, so each suit is a
+# contiguous run of 13 bits
+FULL_MASK = (1 << SUITE_SIZE) - 1
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+SUIT_MASKS = tuple(((1 << len(RANKS)) - 1) << (i * len(RANKS))
+                   for i in range(len(SUITS)))
+# All four cards of each rank
+RANK_MASKS = tuple(sum(1 << (i * len(RANKS) + j) for i in range(len(SUITS)))
+                   for j in range(len(RANKS)))
+# Cards of the same suit ranked strictly below / above each card
+BELOW_MASKS = tuple(SUIT_MASKS[v // len(RANKS)] & ((1 << v) - 1)
+                    for v in range(SUITE_SIZE))
+ABOVE_MASKS = tuple(SUIT_MASKS[v // len(RANKS)] & ~((2 << v) - 1)
+                    for v in range(SUITE_SIZE))
+
+# Weights used to convert between bitmasks and {0,1}^52 vectors
+_BIT_POSITIONS = np.arange(SUITE_SIZE, dtype=np.int64)
+_BIT_WEIGHTS = np.left_shift(np.int64(1), _BIT_POSITIONS)
+
+def one_hot_vector(length, location, dtype=CARD_DTYPE) -> np.array:
     # Create a vector of zeros with a length of length
-    vector = np.zeros(length, dtype=int)
+    vector = np.zeros(length, dtype=dtype)
     # Set the location to 1
     vector[location] = 1
     return vector
@@ -22,19 +44,58 @@ def one_hot_vector(length, location) -> np.array:
 def one_hot_to_value(vector):
     return np.nonzero(vector)[0][0]
 
-# Card is parametrized as a one-hot vector
-class Card(np.ndarray):
+def mask_to_values(mask : int) -> List[int]:
+    """Returns the positions of the set bits of a mask in ascending order."""
+    values = []
+    while mask:
+        lowest = mask & -mask
+        values.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return values
+
+def mask_to_vector(mask : int, dtype=CARD_DTYPE) -> np.ndarray:
+    """Converts a bitmask to a {0,1}^52 vector."""
+    return ((np.int64(mask) >> _BIT_POSITIONS) & 1).astype(dtype, copy=False)
+
+def vector_to_mask(vector) -> int:
+    """Converts a {0,1}^52 vector to a bitmask."""
+    return int(_BIT_WEIGHTS[np.asarray(vector).reshape(-1) > 0].sum())
+
+def vectors_to_masks(vectors) -> np.ndarray:
+    """Converts an (..., 52) array of {0,1} vectors to uint64 bitmasks."""
+    return (np.asarray(vectors) > 0).astype(np.uint64) @ _BIT_WEIGHTS.astype(np.uint64)
+
+def masks_to_vectors(masks) -> np.ndarray:
+    """Converts an array of bitmasks to an (..., 52) array of {0,1} vectors."""
+    masks = np.ascontiguousarray(masks, dtype="<u8")
+    return np.unpackbits(masks[..., None].view(np.uint8), axis=-1,
+                         count=SUITE_SIZE, bitorder="little")
+
+def pack_vectors(vectors) -> np.ndarray:
+    """Bit-packs {0,1}^52 vectors along the last axis into 7 bytes each."""
+    return np.packbits(np.asarray(vectors, dtype=bool), axis=-1, bitorder="little")
+
+def unpack_vectors(packed) -> np.ndarray:
+    """Inverse of pack_vectors."""
+    return np.unpackbits(packed, axis=-1, count=SUITE_SIZE, bitorder="little")
+
+# Card is stored as the index of its bit in a 52-bit mask
+# It converts to a one-hot vector through np.asarray
+# All cards are interned: every constructor returns one of the 52
+# immutable instances in CARDS (or EMPTY_CARD)
+class Card:
+    __slots__ = ("_value", "_mask", "_rank", "_suit", "_dict")
+
     def __new__(cls, rank=None, suit=None, value=None):
         if value is not None:
+            value = int(value)
             if not (0 <= value < SUITE_SIZE):
                 raise ValueError("Value of a card must be between 0 and 51.")
-            obj : np.ndarray = one_hot_vector(length=SUITE_SIZE, location=value)
-            return obj.view(cls)
+            return CARDS[value]
 
         # Empty card
         if rank is None and suit is None:
-            obj : np.ndarray = np.zeros(SUITE_SIZE, dtype=int)
-            return obj.view(cls)
+            return EMPTY_CARD
 
         if rank not in RANKS:
             raise ValueError(f"Invalid rank: {rank}")
@@ -43,52 +104,92 @@ class Card(np.ndarray):
 
         suit_index = SUITS.index(suit)
         rank_index = RANKS.index(rank)
-        value = suit_index * len(RANKS) + rank_index
+        return CARDS[suit_index * len(RANKS) + rank_index]
+
+    @classmethod
+    def _intern(cls, value : int) -> "Card":
+        """Creates the unique instance of a card. Only used to build CARDS."""
+        obj = object.__new__(cls)
+        object.__setattr__(obj, "_value", value)
+        object.__setattr__(obj, "_mask", 1 << value if value >= 0 else 0)
+        object.__setattr__(obj, "_rank", RANKS[value % len(RANKS)])
+        object.__setattr__(obj, "_suit", SUITS[value // len(RANKS)])
+        if value >= 0:
+            card_dict = {'id': value, 'rank': obj._rank, 'suit': obj._suit, 'known': True}
+        else:
+            card_dict = {'id': -1, 'rank': "NA", 'suit': "NA", 'known': False}
+        object.__setattr__(obj, "_dict", card_dict)
+        return obj
+
+    @classmethod
+    def from_vector(cls, vector) -> "Card":
+        """Builds a card from a one-hot (or all-zero) vector."""
+        mask = vector_to_mask(vector)
+        return cls(value=mask.bit_length() - 1) if mask else cls()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Card is immutable.")
 
-        obj : np.ndarray = one_hot_vector(length=SUITE_SIZE, location=value)
-        return obj.view(cls)
+    # Interned cards are never copied
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    # Pickled as its value, one byte, and interned again when loaded
+    def __reduce__(self):
+        return (_card_from_value, (self._value,))
     
     @property
     def rank(self) -> str:
-        return RANKS[self.value % len(RANKS)]
+        return self._rank
     
     @property
     def suit(self) -> str:
-        return SUITS[self.value // len(RANKS)]
+        return self._suit
 
     @property
     def value(self) -> int:
-        if np.asarray(self).sum() < 1:
-            return -1
-        return int(one_hot_to_value(self))
+        return self._value
+
+    @property
+    def mask(self) -> int:
+        return self._mask
+
+    def __array__(self, dtype=None, copy=None):
+        return mask_to_vector(self._mask, dtype=CARD_DTYPE if dtype is None else dtype)
 
     def __bool__(self):
         """Returns False if the card is 'empty' (all zeros)."""
-        return np.any(np.asarray(self))  # False if all elements are 0
+        return self._value >= 0
 
     def __str__(self):
-        return f"{self.suit}_{self.rank}"
+        return f"{self._suit}_{self._rank}"
     
     def __repr__(self):
-        return f"{self.suit}_{self.rank}"
+        return f"{self._suit}_{self._rank}"
 
     def __eq__(self, other):
         if other is None:
-            return not np.any(np.asarray(self))
+            return self._value < 0
         assert isinstance(other, Card), "other must be Card. Got: %s. Other is %s" % (other.__class__.__name__,  other)
         # assert hasattr(other, "value"), "other must be Card.
-        return self.value == other.value
+        return self._value == other._value
     
     def __ne__(self, other):
         return not self == other
 
     def __hash__(self):
-        return self.value
+        return self._value
 
     def __lt__(self, other):
         if not isinstance(other, Card):
             return NotImplemented
-        return self.value < other.value
+        return self._value < other._value
 
     def __le__(self, other):
         return self == other or self < other
@@ -100,82 +201,105 @@ class Card(np.ndarray):
         return not self < other
     
     def get_suit(self) -> str:
-        return self.suit
+        return self._suit
 
     def get_rank(self) -> str:
-        return self.rank
+        return self._rank
 
     # Convert to Dictionary
+    # A copy of the dictionary built when the card was interned, since
+    # the card itself is shared by every game
     def to_dict(self):
-        if self == None:
-            return {
-            'id': -1,
-            'rank': "NA",
-            'suit': "NA",
-            'known': False
-        }
-        return {
-            'id': self.value, 
-            'rank': self.rank,
-            'suit': self.suit, 
-            'known': True
-        }
+        return self._dict.copy()
+
+# Flyweight table of the 52 cards, indexed by value
+CARDS = tuple(Card._intern(value) for value in range(SUITE_SIZE))
+EMPTY_CARD = Card._intern(-1)
+
+def _card_from_value(value : int) -> Card:
+    return CARDS[value] if value >= 0 else EMPTY_CARD
 
 # Abstract class for collections of cards
-# It is a vector of {0,1}^52
-class CardCollection(np.ndarray):
-    def __new__(cls, cards = None):
-        obj = np.zeros(52, dtype=int).view(cls)
+# It is a 52-bit mask, which converts to a vector of {0,1}^52
+# through np.asarray
+class CardCollection:
+    def __init__(self, cards = None):
+        self._mask : int = 0
+        # Sorted card values, cached for the mask they were computed from
+        self._index : tuple = ()
+        self._index_mask : int = 0
 
         if cards is not None:
             if isinstance(cards, (list, tuple)):
                 for card in cards:
-                    obj.add_card(card)  # Use add_card to populate the collection
+                    self.add_card(card)  # Use add_card to populate the collection
             elif isinstance(cards, Card):
-                obj.add_card(cards)
+                self.add_card(cards)
+            elif isinstance(cards, np.ndarray):
+                self._mask = vector_to_mask(cards)
             else:
                 raise TypeError("Expected a list of Cards or a single Card.")
 
+    @classmethod
+    def from_mask(cls, mask : int) -> "CardCollection":
+        """Builds a collection directly from a 52-bit mask."""
+        obj = cls.__new__(cls)
+        obj._mask = mask
+        obj._index = ()
+        obj._index_mask = 0
         return obj
+
+    # Pickled as its class and mask only, the sorted values are a cache
+    def __reduce__(self):
+        return (_collection_from_mask, (type(self), self._mask))
+
+    @property
+    def mask(self) -> int:
+        return self._mask
     
     @property
     def size(self) -> int:
-        return int(self.sum())
+        return self._mask.bit_count()
     
     @property
     def cards(self) -> List[Card]:
-        self_vec = np.asarray(self)
-        return [Card(value=i) for i in range(52) if self_vec[i] > 0]
+        return [CARDS[i] for i in self._sorted_values()]
+
+    def _sorted_values(self) -> tuple:
+        """Returns the sorted card values, rebuilt only if the mask changed."""
+        if self._index_mask != self._mask:
+            self._index = tuple(mask_to_values(self._mask))
+            self._index_mask = self._mask
+        return self._index
+
+    def __array__(self, dtype=None, copy=None):
+        return mask_to_vector(self._mask, dtype=CARD_DTYPE if dtype is None else dtype)
 
     def __repr__(self) -> str:
         return str([card for card in self.cards])
 
     def __iter__(self):
-        self.index = 0  # Initialize the index when iteration starts
-        return self
-
-    def __next__(self):
-        if self.index < self.size:
-            result = self.cards[self.index]
-            self.index += 1
-            return result
-        else:
-            raise StopIteration
+        # Walk the set bits of a snapshot of the mask, lowest card first
+        mask = self._mask
+        while mask:
+            lowest = mask & -mask
+            yield CARDS[lowest.bit_length() - 1]
+            mask ^= lowest
 
     def __getitem__(self, index):
-        return self.cards[index]
+        if isinstance(index, slice):
+            return [CARDS[i] for i in self._sorted_values()[index]]
+        return CARDS[self._sorted_values()[index]]
 
     def __contains__(self, other):
-        if np.asarray(other).sum() < 1:
-            return True
-        index = np.argmax(other)  # Gets the position where card == 1
-        return np.asarray(self)[index] > 0  # Check if the count is greater than 0
+        # A card (or a collection) is contained if all its bits are set
+        return other.mask & ~self._mask == 0
 
     def add_card(self, card):
         """Adds a single Card to the collection."""
         if not isinstance(card, Card):
             raise TypeError("Expected a Card object.")
-        self += card  # Since Card is a one-hot vector, this adds its count.
+        self._mask |= card.mask
 
     def add_cards(self, cards):
         """Adds multiple Cards to the collection."""
@@ -184,50 +308,56 @@ class CardCollection(np.ndarray):
 
     # Add a CardCollection to the collection
     def add_cards_from_collection(self, card_collection : "CardCollection"):
-        self += card_collection
+        self._mask |= card_collection.mask
+
+    def clear(self) -> None:
+        """Removes all cards, keeping the collection object."""
+        self._mask = 0
+
+    def set_mask(self, mask : int) -> None:
+        """Replaces the cards of the collection by those of a 52-bit mask."""
+        self._mask = mask
 
     def contains(self, card : Card) -> bool:
-        # return card in self.cards
-        index = np.argmax(card)  # Gets the position where card == 1
-        return np.asarray(self)[index] > 0  # Check if the count is greater than 0
+        return self._mask & card.mask != 0
 
     # Remove and return a specific card from the collection
     def remove_card(self, card : Card) -> Card:
         """Removes a single card from the collection."""
         if not isinstance(card, Card):
             raise TypeError("Expected a Card object.")
-        if np.any(np.asarray(self - card) < 0):
+        if card.mask & ~self._mask:
             raise ValueError("Cannot remove a card that is not in the collection.")
-        self -= card
+        self._mask ^= card.mask
         return card
 
     def has_card(self, card : Card):
         """Checks if the collection contains a given card."""
         if not isinstance(card, Card):
             raise TypeError("Expected a Card object.")
-        index = np.argmax(card)  # Gets the position where card == 1
-        return np.asarray(self)[index] > 0  # Check if the count is greater than 0
-
+        return self._mask & card.mask != 0
 
     def get_cards(self):
         """Returns a list of Card objects present in the collection."""
-        return [Card(value=i) for i in range(52) if self[i] > 0]
-
-    def is_empty(self):
-        """Checks if the collection is empty."""
-        return np.all(self == 0)
-
+        return self.cards
 
     def __len__(self):
         return self.size
 
+    def copy(self) -> "CardCollection":
+        return self.from_mask(self._mask)
+
     def __add__(self, other) -> "CardCollection":
         """Union of two card collections."""
         if not isinstance(other, (CardCollection, Card)):
             raise TypeError("Can only add another CardCollection.")
-        new_collection = self.copy()
-        new_collection += other
-        return new_collection
+        return self.from_mask(self._mask | other.mask)
+
+    def __iadd__(self, other) -> "CardCollection":
+        if not isinstance(other, (CardCollection, Card)):
+            raise TypeError("Can only add another CardCollection.")
+        self._mask |= other.mask
+        return self
 
     def __sub__(self, other) -> "CardCollection":
         """Removes cards from one collection that exist in another."""
@@ -235,25 +365,27 @@ class CardCollection(np.ndarray):
             raise TypeError("Can only subtract another CardCollection.")
         if not other in self:
             raise ValueError("Cannot remove more cards than present.")
-        new_collection = self.copy()
-        new_collection -= other
-        return new_collection
+        return self.from_mask(self._mask & ~other.mask)
+
+    def __isub__(self, other) -> "CardCollection":
+        if not isinstance(other, (CardCollection, Card)):
+            raise TypeError("Can only subtract another CardCollection.")
+        self._mask &= ~other.mask
+        return self
 
     def intersect(self, other) -> "CardCollection":
         if not isinstance(other, (CardCollection, Card)):
             raise TypeError("Can only intersect another CardCollection or Card.")
-        new_collection = np.asarray(self.copy())
-        new_collection *= np.asarray(other)
-        return new_collection.view(CardCollection)
+        return CardCollection.from_mask(self._mask & other.mask)
 
     def __eq__(self, other):
         if other is None:
-            return not np.any(np.asarray(self))
-        assert isinstance(other, Card ), "other must be Card"
-        return np.array_equal(self, other)
+            return self._mask == 0
+        assert isinstance(other, (CardCollection, Card)), "other must be Card or CardCollection"
+        return self._mask == other.mask
 
     def is_empty(self):
-        return self.size == 0
+        return self._mask == 0
 
     # Sort the cards
     def sort(self):
@@ -268,25 +400,30 @@ class CardCollection(np.ndarray):
     # Get a collection of cards with a specific suit
     def get_cards_by_suit(self, suit) -> "CardCollection":
         if isinstance(suit, str):
-            suit_index = SUITS.index(suit)
+            suit_index = SUIT_INDEX[suit]
         else:
             suit_index = suit
         assert suit_index >= 0 and suit_index < 4, "Invalid suit!"
 
-        mask = np.zeros(SUITE_SIZE, dtype=int)
-        mask[suit_index * len(RANKS) : (suit_index+1) * len(RANKS)]  = 1
-        new_vec = self * mask
-
-        return new_vec
+        return CardCollection.from_mask(self._mask & SUIT_MASKS[suit_index])
 
     def get_cards_by_not_suit(self, suit) -> "CardCollection":
-        return self - self.get_cards_by_suit(suit)
+        suit_index = SUIT_INDEX[suit] if isinstance(suit, str) else suit
+        return CardCollection.from_mask(self._mask & ~SUIT_MASKS[suit_index])
+
+    # Get the cards of the same suit as card that rank below / above it
+    def get_cards_below(self, card : Card) -> "CardCollection":
+        return CardCollection.from_mask(self._mask & BELOW_MASKS[card.value])
+
+    def get_cards_above(self, card : Card) -> "CardCollection":
+        return CardCollection.from_mask(self._mask & ABOVE_MASKS[card.value])
 
     def get_one_random_card(self) -> Card:
-        if not self.cards:
+        values = self._sorted_values()
+        if not values:
             raise ValueError("No cards left in the collection!")
-        random_index = random.randint(0, len(self.cards) - 1)
-        return self.cards[random_index]
+        random_index = random.randint(0, len(values) - 1)
+        return CARDS[values[random_index]]
 
     def to_dict(self):
         return {'cards': [card.to_dict() for card in self.cards]}
@@ -295,6 +432,10 @@ class CardCollection(np.ndarray):
         return [card.to_dict() for card in self.cards]
 
 
+def _collection_from_mask(cls, mask : int) -> CardCollection:
+    return cls.from_mask(mask)
+
+
 class Deck(CardCollection):
     # Constructor to initialize a standard 52-card deck
     def shuffle(self):
@@ -302,10 +443,7 @@ class Deck(CardCollection):
 
     def __init__(self):
         super().__init__()  # Call parent constructor
-
-        for suit in SUITS:
-            for rank in RANKS:
-                self.add_card(Card(rank, suit))
+        self._mask = FULL_MASK
 
     # Deal a card (specific to Deck)
     def deal_card(self) -> Card:
@@ -332,8 +470,6 @@ BLOOD = Card("Ace", "heart")
 
 SPECIAL_CARDS = [PIG, SHEEP, DOUBLER, BLOOD]
 
-EMPTY_CARD = Card()
-
 PIGPEN = CardCollection(
     cards=[Card("King", "spade"), Card("Ace", "spade")]
 )
@@ -0,0 +1,79 @@
+# Vectorized dealing of Gongzhu hands
+# Deals are drawn in batches from a numpy Generator and stored as
+# 52-bit hand masks, one per seat
+import numpy as np
+from typing import Tuple
+from card import SUITE_SIZE
+
+_CARD_WEIGHTS = np.left_shift(np.uint64(1), np.arange(SUITE_SIZE, dtype=np.uint64))
+
+def deal_hands(rng : np.random.Generator, n : int, n_players : int = 4) -> np.ndarray:
+    """
+    Draw n independent deals at once.
+
+    :param rng: The generator used to shuffle the deck.
+    :param n: Number of deals.
+    :param n_players: Number of seats sharing the deck.
+    :return: A (n, n_players) uint64 array of hand masks.
+    """
+    hand_size = SUITE_SIZE // n_players
+    # Each row is an independent permutation of the deck
+    decks = rng.permuted(np.broadcast_to(np.arange(SUITE_SIZE), (n, SUITE_SIZE)), axis=1)
+    decks = decks[:, :hand_size * n_players].reshape(n, n_players, hand_size)
+    return np.bitwise_or.reduce(_CARD_WEIGHTS[decks], axis=-1)
+
+class Dealer:
+    """
+    Iterator over deals, refilled `batch_size` deals at a time.
+    Each deal is a tuple of hand masks (Python ints), one per seat.
+    """
+    def __init__(self, rng : np.random.Generator = None,
+                 batch_size : int = 256, n_players : int = 4):
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._batch_size = batch_size
+        self._n_players = n_players
+        self._deals = np.empty((0, n_players), dtype=np.uint64)
+        self._next_index = 0
+        # Generator state before the current batch was drawn
+        self._batch_state : dict = None
+
+    def seed(self, rng : np.random.Generator) -> None:
+        """Switch to a new generator and drop the deals drawn so far."""
+        self._rng = rng
+        self._deals = np.empty((0, self._n_players), dtype=np.uint64)
+        self._next_index = 0
+        self._batch_state = None
+
+    def get_state(self) -> tuple:
+        """Position of the dealer, enough to replay the same deals."""
+        return (self._batch_state, self._next_index)
+
+    def set_state(self, state : tuple) -> None:
+        """Go back to a position returned by get_state."""
+        batch_state, next_index = state
+        if batch_state is not self._batch_state:
+            if batch_state is None:
+                self._deals = np.empty((0, self._n_players), dtype=np.uint64)
+                self._batch_state = None
+            else:
+                # Draw the same batch again
+                self._rng.bit_generator.state = batch_state
+                self._batch_state = batch_state
+                self._deals = self.deal(self._batch_size)
+        self._next_index = next_index
+
+    def deal(self, n : int) -> np.ndarray:
+        """Draw n deals directly, bypassing the buffer."""
+        return deal_hands(self._rng, n, self._n_players)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Tuple[int, ...]:
+        if self._next_index >= len(self._deals):
+            self._batch_state = self._rng.bit_generator.state
+            self._deals = self.deal(self._batch_size)
+            self._next_index = 0
+        deal = self._deals[self._next_index]
+        self._next_index += 1
+        return tuple(int(mask) for mask in deal)
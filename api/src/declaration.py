@@ -40,6 +40,20 @@ class Declaration:
                 return True
         return False
 
+    def conceal(self, card):
+        # Undo reveal
+        for declaration in self.closed_declarations:
+            if declaration["card"] == card:
+                declaration["revealed"] = False
+                return True
+        return False
+
+    def is_unrevealed(self, card) -> bool:
+        for declaration in self.closed_declarations:
+            if declaration["card"] == card:
+                return not declaration["revealed"]
+        return False
+
     def get_open_declarations(self) -> List[Card]:
         return self.open_declarations
     
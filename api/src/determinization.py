@@ -0,0 +1,238 @@
+# Determinization of Gongzhu hands
+# From the point of view of one seat, the cards of the other three are
+# hidden. A determinization is one assignment of the hidden cards to them
+# consistent with what the seat has seen: the hand sizes, the suits each
+# seat is void in (it did not follow a lead of that suit), the openly
+# declared cards still in hand, and the closed declarations not revealed
+# yet, which are special cards still held by their declarer.
+#
+# Deals are drawn uniformly among the consistent ones without retries.
+# Every hidden card has a set of seats it may go to, so cards fall into at
+# most 7 types. The number of consistent deals is counted for every split
+# of the two-seat types; a split is drawn by its count and the cards of
+# each type are then shuffled among their seats.
+import time
+import numpy as np
+from math import factorial
+from itertools import product
+from typing import List, NamedTuple, Tuple, TYPE_CHECKING
+from card import SUITE_SIZE, SUIT_MASKS, RANKS, PIG, SHEEP, DOUBLER, BLOOD
+from card import mask_to_values, masks_to_vectors
+
+if TYPE_CHECKING:
+    from env import Gongzhu, GongzhuSnapshot
+
+N_SEATS = 4
+DECLARABLE_MASK = PIG.mask | SHEEP.mask | DOUBLER.mask | BLOOD.mask
+
+_FACTORIALS = np.array([float(factorial(n)) for n in range(SUITE_SIZE + 1)])
+_BITS = np.left_shift(np.uint64(1), np.arange(SUITE_SIZE, dtype=np.uint64))
+
+class InformationSet(NamedTuple):
+    # The observing seat and its hand
+    seat : int
+    hand : int
+    # Cards held by the other seats, known or not
+    hidden : int
+    hand_sizes : Tuple[int, ...]
+    # Per seat, the suits (as card masks) it is known to be void in
+    voids : Tuple[int, ...]
+    # Per seat, hidden cards known to be in its hand (open declarations)
+    known : Tuple[int, ...]
+    # Per seat, closed declarations not revealed yet
+    unrevealed : Tuple[int, ...]
+
+def information_set(env : "Gongzhu", seat : int) -> InformationSet:
+    '''
+    What `seat` knows about the hands of the other players of `env`.
+    '''
+    players = [env.get_player_by_index(index) for index in range(N_SEATS)]
+    history = env.get_history()
+    voids = [0] * N_SEATS
+    for round_index, leader in enumerate(env.get_first_player_indices()):
+        cards = history[round_index * N_SEATS:(round_index + 1) * N_SEATS]
+        if not cards:
+            break
+        lead_suit = SUIT_MASKS[cards[0].value // len(RANKS)]
+        for offset, card in enumerate(cards[1:], 1):
+            if not card.mask & lead_suit:
+                voids[(leader + offset) % N_SEATS] |= lead_suit
+    hand = players[seat].get_hand().mask
+    hidden = 0
+    known = [0] * N_SEATS
+    unrevealed = [0] * N_SEATS
+    for index, player in enumerate(players):
+        if index == seat:
+            continue
+        player_hand = player.get_hand().mask
+        hidden |= player_hand
+        declarations = player.get_declarations()
+        for card in declarations.open_declarations:
+            known[index] |= card.mask & player_hand
+        unrevealed[index] = declarations.num_unrevealed
+    return InformationSet(
+        seat=seat,
+        hand=hand,
+        hidden=hidden,
+        hand_sizes=tuple(len(player.get_hand()) for player in players),
+        voids=tuple(voids),
+        known=tuple(known),
+        unrevealed=tuple(unrevealed))
+
+# Number of deals of each split (k3, k5, k6) of the cards of types 3, 5 and 6,
+# given the counts of all types and the capacities of the three seats.
+# Types are bitmasks of the seats a card may go to.
+def _split_counts(counts : List[int], capacities : List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    c = counts
+    r0 = capacities[0] - c[1]
+    r1 = capacities[1] - c[2]
+    r2 = capacities[2] - c[4]
+    k3 = np.arange(c[3] + 1).reshape(-1, 1, 1)
+    k5 = np.arange(c[5] + 1).reshape(1, -1, 1)
+    k6 = np.arange(c[6] + 1).reshape(1, 1, -1)
+    # Capacities left for the cards of type 7
+    free = np.stack(np.broadcast_arrays(r0 - k3 - k5,
+                                        r1 - (c[3] - k3) - k6,
+                                        r2 - (c[5] - k5) - (c[6] - k6)))
+    valid = (free >= 0).all(axis=0)
+    free = np.where(valid, free, 0)
+    f = _FACTORIALS
+    ways = (f[c[3]] / (f[k3] * f[c[3] - k3])
+            * f[c[5]] / (f[k5] * f[c[5] - k5])
+            * f[c[6]] / (f[k6] * f[c[6] - k6])
+            * f[c[7]] / (f[free[0]] * f[free[1]] * f[free[2]]))
+    return np.where(valid, ways, 0.0), free
+
+class DeterminizationSampler:
+    """
+    Samples the hidden hands of an information set.
+
+    :param seed: Seed of the random generator.
+    """
+    def __init__(self, seed : int = None):
+        self.rng = np.random.default_rng(seed)
+        # Totals over all calls, for the sampling rate
+        self.samples : int = 0
+        self.elapsed : float = 0.0
+
+    def rate(self) -> float:
+        """Deals sampled per second so far."""
+        return self.samples / self.elapsed if self.elapsed > 0 else 0.0
+
+    def sample(self, info : InformationSet, k : int) -> np.ndarray:
+        '''
+        Sample `k` deals consistent with `info`.
+
+        :return: (k, 4) uint64 hand masks, the hand of the observing seat
+            included.
+        '''
+        start = time.perf_counter()
+        others = [index for index in range(N_SEATS) if index != info.seat]
+        known = 0
+        for mask in info.known:
+            known |= mask
+        free_cards = info.hidden & ~known
+        capacities = [info.hand_sizes[index] - bin(info.known[index]).count("1") for index in others]
+
+        # Type of a card: seats (bits over `others`) not void in its suit
+        not_void = 1 - masks_to_vectors(np.array([info.voids[index] for index in others], dtype=np.uint64))
+        allowed = (not_void.astype(np.int64) << np.arange(len(others))[:, None]).sum(axis=0)
+
+        # Special cards that may be unrevealed closed declarations are
+        # assigned first, so every declarer keeps enough of them
+        declarable = mask_to_values(free_cards & DECLARABLE_MASK) \
+            if any(info.unrevealed[index] for index in others) else []
+        declarable_mask = sum(1 << value for value in declarable)
+        rest = np.array(mask_to_values(free_cards & ~declarable_mask), dtype=np.int64)
+        types = allowed[rest]
+
+        candidates = []
+        for seats in product(range(len(others)), repeat=len(declarable)):
+            if any(not allowed[value] >> seat & 1 for value, seat in zip(declarable, seats)):
+                continue
+            held = [seats.count(seat) for seat in range(len(others))]
+            if any(held[seat] < info.unrevealed[index] for seat, index in enumerate(others)):
+                continue
+            left = [capacity - count for capacity, count in zip(capacities, held)]
+            if min(left) < 0:
+                continue
+            ways, free = _split_counts(np.bincount(types, minlength=8).tolist(), left)
+            masks = [0] * len(others)
+            for value, seat in zip(declarable, seats):
+                masks[seat] |= 1 << value
+            candidates.append((ways.ravel(), free.reshape(3, -1), ways.shape, masks))
+        weights = np.concatenate([ways for ways, *_ in candidates]) if candidates else np.zeros(0)
+        total = weights.sum()
+        if total == 0:
+            raise ValueError("No deal is consistent with the information set.")
+
+        # Draw a candidate and a split for every sample
+        picks = np.searchsorted(np.cumsum(weights), self.rng.random(k) * total, side="right")
+        picks = np.minimum(picks, len(weights) - 1)
+        offsets = np.cumsum([0] + [len(ways) for ways, *_ in candidates])
+        candidate_index = np.searchsorted(offsets, picks, side="right") - 1
+        splits = picks - offsets[candidate_index]
+        free = np.empty((k, 3), dtype=np.int64)
+        fixed = np.zeros((k, len(others)), dtype=np.uint64)
+        k3, k5, k6 = (np.zeros(k, dtype=np.int64) for _ in range(3))
+        for index, (_, candidate_free, candidate_shape, masks) in enumerate(candidates):
+            rows = candidate_index == index
+            if not rows.any():
+                continue
+            free[rows] = candidate_free[:, splits[rows]].T
+            fixed[rows] = np.array(masks, dtype=np.uint64)
+            k3[rows], k5[rows], k6[rows] = np.unravel_index(splits[rows], candidate_shape)
+
+        # Shuffle the cards of each type and split them by rank
+        seat_of = np.empty((k, len(rest)), dtype=np.int64)
+        for card_type in range(1, 8):
+            columns = np.flatnonzero(types == card_type)
+            if len(columns) == 0:
+                continue
+            ranks = self.rng.random((k, len(columns))).argsort(axis=1).argsort(axis=1)
+            if card_type in (1, 2, 4):
+                seat_of[:, columns] = card_type.bit_length() - 1
+            elif card_type == 3:
+                seat_of[:, columns] = np.where(ranks < k3[:, None], 0, 1)
+            elif card_type == 5:
+                seat_of[:, columns] = np.where(ranks < k5[:, None], 0, 2)
+            elif card_type == 6:
+                seat_of[:, columns] = np.where(ranks < k6[:, None], 1, 2)
+            else:
+                seat_of[:, columns] = (ranks >= free[:, :1]).astype(np.int64) \
+                    + (ranks >= (free[:, 0] + free[:, 1])[:, None])
+
+        hands = np.zeros((k, N_SEATS), dtype=np.uint64)
+        hands[:, info.seat] = info.hand
+        bits = _BITS[rest]
+        for seat, index in enumerate(others):
+            hands[:, index] = np.bitwise_or.reduce(np.where(seat_of == seat, bits, np.uint64(0)), axis=1) \
+                | fixed[:, seat] | np.uint64(info.known[index])
+        self.samples += k
+        self.elapsed += time.perf_counter() - start
+        return hands
+
+def determinize(snapshot : "GongzhuSnapshot", seat : int, hands,
+                rng : np.random.Generator) -> "GongzhuSnapshot":
+    '''
+    The snapshot of a game with the hands of the seats other than `seat`
+    replaced by a sampled deal. Their unrevealed closed declarations are
+    moved to special cards of the new hands.
+
+    :param hands: One row of DeterminizationSampler.sample.
+    '''
+    players = []
+    for index, state in enumerate(snapshot.players):
+        if index == seat:
+            players.append(state)
+            continue
+        hand = int(hands[index])
+        _, collected, played, current, closed, open_ = state
+        revealed = [(value, True) for value, is_revealed in closed if is_revealed]
+        unrevealed = len(closed) - len(revealed)
+        if unrevealed:
+            # Open declarations stay in the hand, so they are never picked
+            free = [value for value in mask_to_values(hand & DECLARABLE_MASK) if value not in open_]
+            revealed += [(int(value), False) for value in rng.choice(free, unrevealed, replace=False)]
+        players.append((hand, collected, played, current, tuple(revealed), open_))
+    return snapshot._replace(players=tuple(players), zobrist_hash=None)
@@ -1,16 +1,25 @@
 # Ok let me try to rewrite everything using gym.Env
 # By Yue Zhang, Feb 11, 2025
 # Updated Feb 18, 2025
-from card import Hand, Card, CardCollection, Deck, PIG, SHEEP, BLOOD, DOUBLER, SPECIAL_CARDS, EMPTY_CARD
-from player import Player
+from card import Hand, Card, CardCollection, PIG, SHEEP, BLOOD, DOUBLER, SPECIAL_CARDS, EMPTY_CARD
+from card import CARDS, CARD_DTYPE, SUITS, FULL_MASK, SUIT_INDEX, SUIT_MASKS, ABOVE_MASKS, pack_vectors, unpack_vectors, masks_to_vectors
+from player import Player, pack_player_state, unpack_player_state
 from policy import Policy, RandomPolicy
 from declaration import Declaration
-
-from typing import List, TYPE_CHECKING, Any, Generic, SupportsFloat, TypeVar
-from random import Random
+from dealer import Dealer
+from scoring import Effects, SCORING_MASK, calc_score_mask
+from zobrist import HAND_KEYS, PLAYED_KEYS, COLLECTED_KEYS, ROUND_KEYS, DECLARATION_PHASE_KEY
+from zobrist import LED_SUIT_KEYS, REVEALED_KEYS, mask_key, effects_key, leader_key
+from zobrist import declarations_key, led_suits_key
+from events import DealEvent, DeclarationEvent, CardPlayedEvent, TrickWonEvent
+from events import EffectChangedEvent, EpisodeEndEvent, EVENT_TYPES, Listener
+
+from typing import List, NamedTuple, Tuple, TYPE_CHECKING, Any, Generic, SupportsFloat, TypeVar
 import gymnasium as gym
 from gymnasium.spaces import Discrete, Box, Sequence, Dict, Space
 import secrets
+import struct
+from functools import lru_cache
 import sqlite3
 import json
 import os
@@ -24,6 +33,135 @@ RenderFrame = TypeVar("RenderFrame")
 
 DB_DIR = os.path.join("/data/record.db")
 
+# Special cards that cannot be played while openly declared and
+# their suit has not been led yet, with the index of that suit
+_OPEN_DECLARATION_RULES = [(PIG, "_pig_effect", SUIT_INDEX["spade"]),
+                           (SHEEP, "_sheep_effect", SUIT_INDEX["diamond"]),
+                           (BLOOD, "_blood_effect", SUIT_INDEX["heart"]),
+                           (DOUBLER, "_doubler_effect", SUIT_INDEX["club"])]
+# Indexed by the lead suit; -1 (leading a round) selects the whole hand
+_LEAD_MASKS = np.array([*SUIT_MASKS, FULL_MASK], dtype=np.uint64)
+
+# Full rules state of a game, see Gongzhu.snapshot
+class GongzhuSnapshot(NamedTuple):
+    # Player.snapshot of each seat: hand, collected and played masks,
+    # current card and declarations
+    players : Tuple[tuple, ...]
+    # Card values played this round, in order
+    played_this_round : Tuple[int, ...]
+    first_player_index : int
+    current_player_index : int
+    round_count : int
+    declaration_phase : bool
+    has_moved : Tuple[bool, ...]
+    effects : Effects
+    # Rounds led in each suit, in the order of SUITS
+    suit_rounds : Tuple[int, ...]
+    scores : Tuple[float, ...]
+    # Card values of the history and first player of each round
+    history : bytes
+    first_player_indices : bytes
+    # Dealer.get_state
+    dealer_state : tuple
+    zobrist_hash : int
+
+# Binary form of a GongzhuSnapshot, without its dealer state: a fixed
+# header, then the cards played this round, the history, the first
+# players, the scores and the packed player states, each prefixed by
+# its length in one byte. Effects and scores are kept as doubles
+_SNAPSHOT_HEADER = struct.Struct("<bbB?B4d4B?Q")
+
+def pack_snapshot(snapshot : GongzhuSnapshot) -> bytes:
+    """Packs a snapshot, except its dealer state, into about 200 bytes."""
+    has_moved = sum(1 << index for index, moved in enumerate(snapshot.has_moved) if moved)
+    has_hash = snapshot.zobrist_hash is not None
+    header = _SNAPSHOT_HEADER.pack(
+        snapshot.first_player_index, snapshot.current_player_index, snapshot.round_count,
+        snapshot.declaration_phase, has_moved, *snapshot.effects, *snapshot.suit_rounds,
+        has_hash, snapshot.zobrist_hash if has_hash else 0)
+    sections = [bytes(snapshot.played_this_round), snapshot.history,
+                snapshot.first_player_indices,
+                struct.pack(f"<{len(snapshot.scores)}d", *snapshot.scores),
+                *(pack_player_state(state) for state in snapshot.players)]
+    return header + b"".join(bytes([len(section)]) + section for section in sections)
+
+def unpack_snapshot(data : bytes, dealer_state : tuple = (None, 0)) -> GongzhuSnapshot:
+    """Inverse of pack_snapshot, with the dealer state given apart."""
+    (first_player_index, current_player_index, round_count, declaration_phase, has_moved,
+     *rest) = _SNAPSHOT_HEADER.unpack_from(data)
+    effects, suit_rounds, (has_hash, zobrist_hash) = tuple(rest[:4]), tuple(rest[4:8]), rest[8:]
+    sections = []
+    offset = _SNAPSHOT_HEADER.size
+    while offset < len(data):
+        length = data[offset]
+        sections.append(data[offset + 1:offset + 1 + length])
+        offset += 1 + length
+    played_this_round, history, first_player_indices, scores, *players = sections
+    return GongzhuSnapshot(
+        players=tuple(unpack_player_state(state) for state in players),
+        played_this_round=tuple(played_this_round),
+        first_player_index=first_player_index,
+        current_player_index=current_player_index,
+        round_count=round_count,
+        declaration_phase=declaration_phase,
+        has_moved=tuple(bool(has_moved >> index & 1) for index in range(len(players))),
+        effects=effects,
+        suit_rounds=suit_rounds,
+        scores=struct.unpack(f"<{len(scores) // 8}d", scores),
+        history=history,
+        first_player_indices=first_player_indices,
+        dealer_state=dealer_state,
+        zobrist_hash=zobrist_hash if has_hash else None)
+
+# Card play position with all hands known, see Gongzhu.endgame_position
+class EndgamePosition(NamedTuple):
+    hands : Tuple[int, ...]
+    collected : Tuple[int, ...]
+    # Card values played this round, starting with the leader's
+    round_cards : Tuple[int, ...]
+    leader : int
+    round_count : int
+    effects : Effects
+    # Openly declared cards, blocked until a round of their suit is complete
+    open_declared : int
+    # Closed declared cards, and those revealed by being played
+    closed_declared : int
+    revealed : int
+    # Bit i is set once a round of SUITS[i] is complete
+    led_suits : int
+
+@lru_cache(maxsize=1 << 16)
+def legal_move_mask(hand_mask : int, lead_suit : int, blocked_mask : int) -> int:
+    '''
+    Legal moves of a hand as a bitmask.
+
+    :param hand_mask: Mask of the cards in hand.
+    :param lead_suit: Index of the suit led this round, -1 if leading.
+    :param blocked_mask: Openly declared cards whose suit was not led yet.
+    '''
+    legal = hand_mask & SUIT_MASKS[lead_suit] if lead_suit >= 0 else hand_mask
+    # If no cards of the same suit, then the whole hand is legal
+    if legal == 0:
+        return hand_mask
+    # Blocked cards are only removed if something else remains
+    if legal & (legal - 1) and legal & ~blocked_mask:
+        legal &= ~blocked_mask
+    return legal
+
+def legal_move_masks(hand_masks, lead_suit, blocked_mask) -> np.ndarray:
+    '''
+    Vectorized legal_move_mask over any broadcastable arrays of inputs,
+    e.g. the four seats of a game or a batch of games.
+    '''
+    hands = np.asarray(hand_masks, dtype=np.uint64)
+    blocked = np.asarray(blocked_mask, dtype=np.uint64)
+    suited = hands & _LEAD_MASKS[np.asarray(lead_suit)]
+    is_following_suit = suited != 0
+    legal = np.where(is_following_suit, suited, hands)
+    restricted = legal & ~blocked
+    apply = is_following_suit & ((legal & (legal - np.uint64(1))) != 0) & (restricted != 0)
+    return np.where(apply, restricted, legal)
+
 
 # Class of Gongzhu game using gym.Env
 class Gongzhu(gym.Env):
@@ -68,7 +206,11 @@ class Gongzhu(gym.Env):
     def __init__(self, 
             render_mode=None, 
             enable_declaration : bool = False,
-            n_players : int = 4):
+            n_players : int = 4,
+            flat_observations : bool = False,
+            skip_forced_moves : bool = True,
+            fast_forward : bool = False,
+            headless : bool = False):
         # A random unique identifier
         self._id : str = secrets.token_hex(16)
 
@@ -99,6 +241,20 @@ class Gongzhu(gym.Env):
             "first_player_indices": Sequence(Discrete(4)),
             "is_declaration_phase": Space()},
         )
+        # Optional fixed-shape observations, see to_flat_state
+        # Headless envs only have those
+        self._flat_observations : bool = flat_observations or headless
+        if self._flat_observations:
+            self.observation_space = Dict(
+                {"agent_info": Box(0, 1, shape=(6, 52), dtype=CARD_DTYPE),
+                "players_info": Box(0, 13, shape=(n_players - 1, 6, 52), dtype=CARD_DTYPE),
+                "history": Box(0, 1, shape=(52, 52), dtype=np.float32),
+                "history_length": Discrete(53),
+                "first_player_indices": Box(0, n_players - 1, shape=(self._max_rounds,), dtype=np.int64),
+                "is_declaration_phase": Discrete(2),
+                "scores": Box(-np.inf, np.inf, shape=(n_players,), dtype=np.float64),
+                "legal_mask": Box(0, 1, shape=(52,), dtype=CARD_DTYPE)},
+            )
 
         # Initialize the effects of each special card
         self._pig_effect : float = 1.0
@@ -121,6 +277,21 @@ class Gongzhu(gym.Env):
         self._my_team_score : int = 0
         self._opponent_team_score : int = 0
 
+        # Score of each player. Scores only change when a round is
+        # collected or when the declaration effects change, so they are
+        # updated there instead of being recomputed on every query
+        self._scores : List[float] = [0.0] * n_players
+
+        # Observation buffers owned by the env and updated in place as
+        # cards are played, see to_buffers. They follow the layout of
+        # Player.vec_full (agent) and Player.vec_partial (opponents)
+        self._agent_obs : np.ndarray = np.zeros((6, 52), dtype=CARD_DTYPE)
+        self._players_obs : np.ndarray = np.zeros((n_players - 1, 6, 52), dtype=CARD_DTYPE)
+        # One-hot history, one row per card played
+        self._history_obs : np.ndarray = np.zeros((52, 52), dtype=np.float32)
+        self._first_player_obs : np.ndarray = np.zeros(self._max_rounds, dtype=np.int64)
+        self._scores_obs : np.ndarray = np.zeros(n_players)
+
         # Whether declaration is enabled or not
         self._enable_declaration : bool = enable_declaration
 
@@ -132,23 +303,48 @@ class Gongzhu(gym.Env):
 
         self._first_player_indices : List[int] = []
 
+        # Moves made by apply_move, reverted by undo_move
+        self._undo_stack : List[tuple] = []
+
+        # Zobrist hash of the position, updated incrementally, see zobrist.py
+        self._hash : int = 0
+
+        # Players with a single legal move play it without asking their
+        # policy; such moves are counted per game
+        self._skip_forced_moves : bool = skip_forced_moves
+        self._forced_moves : int = 0
+
+        # If True, step stops the game as truncated, with the final
+        # reward, as soon as the remaining rounds cannot change the scores
+        self._fast_forward : bool = fast_forward
+
+        # Headless simulation: no dicts for the web API, no logging and no
+        # validation of the moves, which are trusted
+        self._headless : bool = headless
+
+        # Callbacks of each event type, see events.py and subscribe
+        # Only non-empty lists are kept, so an empty dict means that
+        # nobody listens and no event is built
+        self._listeners : dict[type, List[Listener]] = {}
+
         self._suit_rounds : dict[str : int] = {
             "spade": 0,
             "heart": 0,
             "diamond": 0,
             "club": 0,
         }
+
+        # Deals are drawn in batches from the per-env generator,
+        # which is reseeded by reset(seed=...)
+        self._dealer : Dealer = Dealer(self.np_random, n_players=self._n_players)
         # Start the game
         # self.start()
 
     # Start the game
     def start(self):
         # First, deal cards to players
-        deck = Deck()
-        deck.shuffle()
-        for player in self._players:
-            for _ in range(13):
-                player.add_card_to_hand(deck.deal_card())
+        for player, hand_mask in zip(self._players, next(self._dealer)):
+            player.get_hand().set_mask(int(hand_mask))
             player.sort_hand()
         # Initialize the effects of each special card
         self._pig_effect : float = 1.0
@@ -156,8 +352,10 @@ class Gongzhu(gym.Env):
         self._doubler_effect : float = 1.0
         self._blood_effect : float = 1.0
         # Reset round counts
+        # Lists and dicts are cleared in place, to reuse them across games
         self._round_count = 0
-        self._playedCardsThisRound = []
+        self._playedCardsThisRound.clear()
+        self._forced_moves = 0
         # Figure out the first player initially
         self._first_player_index = self._who_goes_first_initial(self._players)
         self._current_player_index = self._first_player_index
@@ -165,26 +363,34 @@ class Gongzhu(gym.Env):
         # Clear scores of both teams
         self._my_team_score : int = 0
         self._opponent_team_score : int = 0
+        for index in range(len(self._players)):
+            self._update_score(index)
         # Initialize the game history
-        self._history = []
+        self._history.clear()
 
         # Set the phase to declaration phase
         self._declaration_phase = self._enable_declaration
 
-        self._has_moved = [False, False, False, False]
-
-        self._suit_rounds = {
-            "spade": 0,
-            "heart": 0,
-            "diamond": 0,
-            "club": 0,
-        }
-
-        self._first_player_indices = [self._first_player_index]
-        return self.to_dict()
+        self._has_moved[:] = [False, False, False, False]
+
+        for suit in self._suit_rounds:
+            self._suit_rounds[suit] = 0
+
+        self._first_player_indices.clear()
+        self._first_player_indices.append(self._first_player_index)
+        self._undo_stack.clear()
+        self._hash = self.compute_hash()
+        self._reset_observation()
+        if self._listeners:
+            self._emit(DealEvent(
+                hands=tuple(player.get_hand().mask for player in self._players),
+                first_player_index=self._first_player_index))
+        if not self._headless:
+            return self.to_dict()
     
     # Update known declaration effects
     def update_effects(self):
+        old_effects = self.effects()
         for player in self._players:
             declarations = player.get_declarations()
             closed_declarations = declarations.get_revealed_closed_declarations()
@@ -207,39 +413,116 @@ class Gongzhu(gym.Env):
                     self._doubler_effect = 4.0
                 elif card.get_rank() == self.BLOOD.get_rank():
                     self._blood_effect = 4.0
+        # Rescore everyone if any multiplier changed
+        if old_effects != self.effects():
+            self._hash ^= effects_key(old_effects) ^ effects_key(self.effects())
+            for index in range(len(self._players)):
+                self._update_score(index)
+            if self._listeners:
+                self._emit(EffectChangedEvent(old_effects, self.effects()))
+
+    # Recompute the cached score of one player
+    def _update_score(self, index : int) -> None:
+        self._scores[index] = self._players[index].get_score(self)
+        self._scores_obs[index] = self._scores[index]
+
+    # Matrix of a player in the observation buffers, and the row
+    # of its collected cards (followed by played and current cards)
+    def _seat_obs(self, index : int):
+        if index == 0:
+            return self._agent_obs, 1
+        return self._players_obs[index - 1], 0
+
+    def _reset_observation(self) -> None:
+        self._agent_obs.fill(0)
+        self._agent_obs[0] = self._players[0].get_hand()
+        self._players_obs.fill(0)
+        self._history_obs.fill(0)
+        self._first_player_obs.fill(0)
+        self._first_player_obs[0] = self._first_player_index
+        self._observe_declarations()
+
+    def _observe_declarations(self) -> None:
+        declarations = [player.get_declarations() for player in self._players]
+        # Agent sees all its closed declarations, others only revealed ones
+        masks = [CardCollection(declarations[0].get_all_closed_declarations()).mask,
+                 CardCollection(declarations[0].get_open_declarations()).mask]
+        for declaration in declarations[1:]:
+            masks.append(CardCollection(declaration.get_revealed_closed_declarations()).mask)
+            masks.append(CardCollection(declaration.get_open_declarations()).mask)
+        vectors = masks_to_vectors(np.array(masks, dtype=np.uint64))
+        self._agent_obs[4:] = vectors[:2]
+        self._players_obs[:, 3:5] = vectors[2:].reshape(len(self._players_obs), 2, 52)
+        self._players_obs[:, 5, 0] = [declaration.num_unrevealed for declaration in declarations[1:]]
+
+    # Record a card just played by a player in the observation buffers
+    def _observe_move(self, index : int, card : Card) -> None:
+        value = card.value
+        if index == 0:
+            self._agent_obs[0, value] = 0
+        obs, row = self._seat_obs(index)
+        obs[row + 1, value] = 1
+        obs[row + 2, value] = 1
+        self._history_obs[len(self._history) - 1, value] = 1
+        # Playing a closed declaration reveals it
+        if card in SPECIAL_CARDS:
+            self._observe_declarations()
+
+    # Revert _observe_move, after the card went back to the hand
+    def _unobserve_move(self, index : int, card : Card) -> None:
+        value = card.value
+        if index == 0:
+            self._agent_obs[0, value] = 1
+        obs, row = self._seat_obs(index)
+        obs[row + 1, value] = 0
+        obs[row + 2, value] = 0
+        self._history_obs[len(self._history), value] = 0
+        if card in SPECIAL_CARDS:
+            self._observe_declarations()
+
+    # Record the collection of a round in the observation buffers
+    def _observe_round(self, largest_index : int) -> None:
+        obs, row = self._seat_obs(largest_index)
+        for card in self._playedCardsThisRound:
+            obs[row, card.value] = 1
+        self._agent_obs[3] = 0
+        self._players_obs[:, 2] = 0
 
     # Get current legal moves of the agent
     def agent_legal_moves(self) -> CardCollection:
         agent_hand = self._players[0].get_hand()
         return self.legal_moves(agent_hand, self._playedCardsThisRound)
 
+    # Openly declared special cards that cannot be played yet
+    def blocked_mask(self) -> int:
+        mask = 0
+        for card, effect, suit_index in _OPEN_DECLARATION_RULES:
+            if getattr(self, effect) >= 4.0 and self._suit_rounds[SUITS[suit_index]] == 0:
+                mask |= card.mask
+        return mask
+
+    def lead_suit_index(self, played_cards : List[Card]) -> int:
+        return -1 if len(played_cards) == 0 else SUIT_INDEX[played_cards[0].get_suit()]
+
     # Get the legal moves
     def legal_moves(self, hand : Hand, played_cards : List[Card]) \
         -> CardCollection:
         '''
         Return a CardCollection of legal moves for a given hand and played cards.
         If no cards were played, any card in the hand is legal.
+        Special rule: if the suit is the same as an openly declared card,
+        and this suit is not yet played, then this openly declared card
+        is illegal.
         '''
-
-        # If no cards were played, any card in the hand is legal
-        legal_moves = hand if len(played_cards) == 0 else hand.get_cards_by_suit(played_cards[0].get_suit())
-        # If no cards of the same suit, then the whole hand is legal
-        is_following_suit = not legal_moves.is_empty()
-        legal_moves = legal_moves if is_following_suit else hand
-        # Special rule: if the suit is the same as an openly declared card,
-        # and this suit is not yet played, then this openly declared card
-        # is illegal
-        legal_moves = CardCollection(cards=legal_moves.cards)
-        if len(legal_moves) > 1 and is_following_suit:
-            if self._pig_effect >= 4.0 and PIG in legal_moves and self._suit_rounds['spade'] == 0:
-                legal_moves -= PIG
-            if self._sheep_effect >= 4.0 and SHEEP in legal_moves and self._suit_rounds['diamond'] == 0:
-                legal_moves -= SHEEP
-            if self._blood_effect >= 4.0 and BLOOD in legal_moves and self._suit_rounds['heart'] == 0:
-                legal_moves -= BLOOD
-            if self._doubler_effect >= 4.0 and DOUBLER in legal_moves and self._suit_rounds['club'] == 0:
-                legal_moves -= DOUBLER
-        return legal_moves
+        return CardCollection.from_mask(legal_move_mask(
+            hand.mask, self.lead_suit_index(played_cards), self.blocked_mask()))
+
+    # Legal moves of all four seats for the current round, as an array of masks
+    def legal_masks(self) -> np.ndarray:
+        return legal_move_masks(
+            [player.get_hand().mask for player in self._players],
+            self.lead_suit_index(self._playedCardsThisRound),
+            self.blocked_mask())
     
     # find the index of the player who played the largest card
     def find_largest_index(self, played_cards : List[Card]) -> int:
@@ -254,57 +537,14 @@ class Gongzhu(gym.Env):
                 index = i
         return index
 
+    # Multipliers of (pig, sheep, doubler, blood) set by the declarations
+    def effects(self) -> Effects:
+        return (self._pig_effect, self._sheep_effect, self._doubler_effect, self._blood_effect)
+
     # Calculate the score based on a hand
-    # TODO: rewrite using matrix operations
+    # Scores are looked up from the 16 scoring cards, see scoring.py
     def calc_score(self, collected_cards : CardCollection) -> float:
-        score = 0
-        has_pig = False
-        has_sheep = False
-        has_doubler = False
-        has_all_blood = True
-        no_blood = True
-
-        # Score of pig
-        if collected_cards.contains(Gongzhu.PIG):
-            score -= 100.0 * self._pig_effect
-            has_pig = True
-
-        # Score of sheep
-        if collected_cards.contains(Gongzhu.SHEEP):
-            score += 100.0 * self._sheep_effect
-            has_sheep = True
-
-        # Score of blood
-        blood_score_total = 0
-        for blood_card in Gongzhu.BLOOD_CARDS:
-            card = Card(blood_card.get_rank(), "heart")
-            if collected_cards.contains(card):
-                blood_score_total += blood_card.get_score()
-                no_blood = False
-            else:
-                has_all_blood = False
-
-        if has_all_blood:
-            score += blood_score_total * self._blood_effect
-        else:
-            score -= blood_score_total * self._blood_effect
-
-        # Score of doubler
-        if collected_cards.contains(Gongzhu.DOUBLER):
-            has_doubler = True
-
-        # Bonus if collected everything
-        if has_pig and has_sheep and has_all_blood and has_doubler:
-            score += 200.0 * self._pig_effect
-
-        # Effect of doubler
-        if has_doubler:
-            if not has_pig and not has_sheep and no_blood:
-                score += 50 * self._doubler_effect
-            else:
-                score *= 2 * self._doubler_effect
-
-        return score
+        return calc_score_mask(collected_cards.mask, self.effects())
 
     # Find the index of the player who goes first in the beginning of the game
     def _who_goes_first_initial(self, players : List[Player]) -> int:
@@ -343,7 +583,7 @@ class Gongzhu(gym.Env):
         # print(f"Round {self._round_count} ends")
         # print(f"Length of history is {len(self._history)} ")
         # Sanity check: ensure each player has exactly same number of cards
-        assert \
+        assert self._headless or \
             (len(self._players[0].get_hand()) == len(self._players[1].get_hand()) ) and \
             (len(self._players[0].get_hand()) == len(self._players[2].get_hand()) ) and \
             (len(self._players[0].get_hand()) == len(self._players[3].get_hand()) ), \
@@ -353,8 +593,10 @@ class Gongzhu(gym.Env):
         # Check if it is the declaration phase
         if self._declaration_phase:
             self._declaration_phase = False
+            self._hash ^= DECLARATION_PHASE_KEY
             self._current_player_index = self._first_player_index
             self.update_effects()
+            self._observe_declarations()
             return 
         # Increase the round count by 1
         self._round_count += 1
@@ -363,11 +605,22 @@ class Gongzhu(gym.Env):
         # The largest player collects all the cards played this round
         self._players[largest_index].add_collected_cards(self._playedCardsThisRound)
         self._players[largest_index].sort_collected_cards()
+        self._update_score(largest_index)
+        self._observe_round(largest_index)
+        self._hash_round(largest_index, self._playedCardsThisRound)
+        leader = self._first_player_index
+        if self._listeners:
+            self._emit(TrickWonEvent(
+                winner=largest_index, leader=leader, cards=tuple(self._playedCardsThisRound),
+                round_count=self._round_count, scores=tuple(self._scores)))
         # Empty the currentPlayedCard of players
         for player in self._players:
             player.remove_current_played_card()
         # Increase suit round by one
-        self._suit_rounds[self._playedCardsThisRound[0].get_suit()] += 1
+        suit = self._playedCardsThisRound[0].get_suit()
+        self._suit_rounds[suit] += 1
+        if self._suit_rounds[suit] == 1:
+            self._hash ^= LED_SUIT_KEYS[SUIT_INDEX[suit]]
         # Empty the played cards of this round
         self._playedCardsThisRound = []
         # Update the current player index
@@ -377,11 +630,15 @@ class Gongzhu(gym.Env):
             # # Save the game history
             # print("Saving game history...")
             self.save_histroy()
+            if self._listeners:
+                self._emit(EpisodeEndEvent(scores=tuple(self._scores), truncated=False))
         else:
             self._first_player_index = largest_index
             self._current_player_index = largest_index
             # Update the list of first player indices
             self._first_player_indices.append(self._current_player_index)
+            self._first_player_obs[self._round_count] = self._current_player_index
+        self._hash ^= leader_key(leader) ^ leader_key(self._first_player_index)
 
         return {
             "largestIndex": largest_index,
@@ -393,15 +650,21 @@ class Gongzhu(gym.Env):
         self._has_moved[old_player_index] = True
         # Check if right now is the declaration phase
         if self.is_declaration_phase():
-            print(f"player {old_player_index} is making a declaration")
+            if not self._headless:
+                print(f"player {old_player_index} is making a declaration")
             declarations : Declaration = self._players[self._current_player_index].policy.decide_declarations(
                 hand=self._players[self._current_player_index].get_hand(),
-                game_info=self.to_dict()
+                game_info=self.to_state() if self._headless else self.to_dict()
             )
-            self._players[self._current_player_index].set_declarations(declarations)
+            self._set_declarations(self._current_player_index, declarations)
+            self._observe_declarations()
+            if self._listeners:
+                self._emit(DeclarationEvent(old_player_index, declarations))
             self._current_player_index = (self._current_player_index + 1) % self._n_players
             if self.is_end_one_round():
                 self.next_round()
+            if self._headless:
+                return None
             return {
                 "currentPlayerIndex": old_player_index,
                 "move": declarations.to_dict(),
@@ -409,34 +672,92 @@ class Gongzhu(gym.Env):
             pass
         # Play a card based on the policy
         legal_moves = self.legal_moves(self._players[self._current_player_index].get_hand(), self._playedCardsThisRound)
-        move : Card = self._players[self._current_player_index].policy.decide_action(
-            legal_moves=legal_moves, 
-            game_info=self.to_state()
-        )
+        if self._skip_forced_moves and len(legal_moves) == 1:
+            move : Card = legal_moves[0]
+            self._forced_moves += 1
+        else:
+            policy = self._players[self._current_player_index].policy
+            move : Card = policy.decide_action(
+                legal_moves=legal_moves, 
+                game_info=self.to_policy_buffers() if policy.reads_buffers else self.to_policy_state()
+            )
+        revealing = False
         if move in SPECIAL_CARDS:
             self.update_effects()
+            revealing = self._players[self._current_player_index].get_declarations().is_unrevealed(move)
         self._playedCardsThisRound.append(move)
         self._players[self._current_player_index].play_specific_card(move)
         # Update the current player index
         self._current_player_index = (self._current_player_index + 1) % self._n_players
         # Update the game history
         self.add_history(move)
+        self._observe_move(old_player_index, move)
+        self._hash_move(old_player_index, move, revealing)
+        if self._listeners:
+            self._emit(CardPlayedEvent(old_player_index, move, self._round_count,
+                                       len(self._playedCardsThisRound) - 1))
         # print(f"Player {old_player_index} played {move}")
+        if self._headless:
+            return None
         return {
             "currentPlayerIndex": old_player_index,
             "move": move.to_dict(),
         }
 
+    # Final scores if the remaining rounds cannot change them, else None:
+    # either no scoring card is left in play, or the last ones are in the
+    # round in progress and no player still to play can take the lead
+    def determined_scores(self) -> List[float]:
+        in_hands = 0
+        for player in self._players:
+            in_hands |= player.get_hand().mask
+        if in_hands & SCORING_MASK:
+            return None
+        played = self._playedCardsThisRound
+        round_mask = 0
+        for card in played:
+            round_mask |= card.mask
+        if not round_mask & SCORING_MASK:
+            return list(self._scores)
+        largest_index = self.find_largest_index(played)
+        higher = ABOVE_MASKS[played[largest_index].value]
+        for offset in range(len(played), self._n_players):
+            index = (self._first_player_index + offset) % self._n_players
+            if self._players[index].get_hand().mask & higher:
+                return None
+        winner = (self._first_player_index + largest_index) % self._n_players
+        scores = list(self._scores)
+        scores[winner] = calc_score_mask(
+            self._players[winner].get_collected_cards().mask | round_mask, self.effects())
+        return scores
+
+    # The only legal move of the current player, None if there is a choice
+    # Callers driving the agent can play it without asking a policy
+    def forced_move(self) -> Card:
+        if self._declaration_phase or self.is_end_episode():
+            return None
+        legal_moves = self.legal_moves(self._players[self._current_player_index].get_hand(), self._playedCardsThisRound)
+        return legal_moves[0] if len(legal_moves) == 1 else None
+
+    # Forced moves played without a decision in this game, see forced_move
+    # Those of the agent are only counted when its caller reports them to step
+    def forced_move_count(self) -> int:
+        return self._forced_moves
+
     def agent_declarations(self, declarations: Declaration):
         # # For debug purposes
         # return self.next_player() 
-        if self.is_legal_declarations(self._players[self._current_player_index], declarations):
+        if self._headless or self.is_legal_declarations(self._players[self._current_player_index], declarations):
             self._has_moved[0] = True
-            self._players[self._current_player_index].set_declarations(declarations)
+            self._set_declarations(self._current_player_index, declarations)
+            self._observe_declarations()
+            if self._listeners:
+                self._emit(DeclarationEvent(self._current_player_index, declarations))
             self._current_player_index = (self._current_player_index + 1) % self._n_players
             if self.is_end_one_round():
                 self.next_round()
-            return self.to_dict()   
+            if not self._headless:
+                return self.to_dict()   
         else:
             return None
 
@@ -445,31 +766,382 @@ class Gongzhu(gym.Env):
 
     def play_selected_card(self, card : Card):
         # Check if the current player can play this card
-        if self.is_legal_move(self._players[self._current_player_index], card):
+        if self._headless or self.is_legal_move(self._players[self._current_player_index], card):
+            player_index = self._current_player_index
             self._has_moved[0] = True
+            revealing = False
             if card in SPECIAL_CARDS:
                 self.update_effects()
+                revealing = self._players[self._current_player_index].get_declarations().is_unrevealed(card)
             self._playedCardsThisRound.append(card)
             self._players[self._current_player_index].play_specific_card(card)
             # Update the current player index
             self._current_player_index = (self._current_player_index + 1) % self._n_players
             # Update the game history
             self.add_history(card)
-            return self.to_dict()   
+            self._observe_move(player_index, card)
+            self._hash_move(player_index, card, revealing)
+            if self._listeners:
+                self._emit(CardPlayedEvent(player_index, card, self._round_count,
+                                           len(self._playedCardsThisRound) - 1))
+            if not self._headless:
+                return self.to_dict()   
         else:
             return None
 
     def to_state(self):
+        '''
+        Observation as a new dict of copies, which stays valid as the game
+        goes on. It still allocates on every call, unlike to_buffers, which
+        gives views of the observation buffers and should be used where
+        the state is not kept.
+        '''
         # return self.to_dict()
-        return {"agent_info": self._players[0].vec_full, 
-            "players_info": np.array([self._players[1].vec_partial,
-                 self._players[2].vec_partial,
-                 self._players[3].vec_partial]),
-            "history": self._history,
-            "first_player_indices": self._first_player_indices,
+        # The buffers and history lists are updated in place and reused
+        # by the next game, so they are copied
+        return {"agent_info": self._agent_obs.copy(), 
+            "players_info": self._players_obs.copy(),
+            "history": self._history.copy(),
+            "first_player_indices": self._first_player_indices.copy(),
+            "is_declaration_phase": self._declaration_phase,
+            "scores": self._scores_obs.copy()} 
+
+    # State given to the policies that play: to_state with the env, from
+    # which the endgame solver takes the full position and search policies
+    # sample the hidden hands
+    def to_policy_state(self):
+        state = self.to_state()
+        state["env"] = self
+        return state
+
+    # The same with the observation buffers instead of copies, for the
+    # policies that read them (Policy.reads_buffers)
+    def to_policy_buffers(self):
+        buffers = self.to_buffers()
+        buffers["env"] = self
+        return buffers
+
+    # Call `listener` with every event of type `event_type` (see events.py)
+    def subscribe(self, event_type : type, listener : Listener) -> None:
+        assert event_type in EVENT_TYPES, f"Unknown event type: {event_type}"
+        self._listeners.setdefault(event_type, []).append(listener)
+
+    def unsubscribe(self, event_type : type, listener : Listener) -> None:
+        listeners = self._listeners.get(event_type, [])
+        if listener in listeners:
+            listeners.remove(listener)
+        if not listeners:
+            self._listeners.pop(event_type, None)
+
+    # Listeners may unsubscribe while being called, so a copy is walked
+    def _emit(self, event) -> None:
+        for listener in tuple(self._listeners.get(type(event), ())):
+            listener(event)
+
+    # Capture the rules state of the game in an immutable snapshot
+    # Players and policies are not copied: a snapshot can only be
+    # restored into the env it was taken from, or one with the same players
+    def snapshot(self) -> GongzhuSnapshot:
+        return GongzhuSnapshot(
+            players=tuple(player.snapshot() for player in self._players),
+            played_this_round=tuple(card.value for card in self._playedCardsThisRound),
+            first_player_index=self._first_player_index,
+            current_player_index=self._current_player_index,
+            round_count=self._round_count,
+            declaration_phase=self._declaration_phase,
+            has_moved=tuple(self._has_moved),
+            effects=self.effects(),
+            suit_rounds=tuple(self._suit_rounds[suit] for suit in SUITS),
+            scores=tuple(self._scores),
+            history=bytes(card.value for card in self._history),
+            first_player_indices=bytes(self._first_player_indices),
+            dealer_state=self._dealer.get_state(),
+            zobrist_hash=self._hash)
+
+    # Go back to the state captured by snapshot
+    def restore(self, snapshot : GongzhuSnapshot) -> None:
+        for player, state in zip(self._players, snapshot.players):
+            player.restore(state)
+        self._playedCardsThisRound = [CARDS[value] for value in snapshot.played_this_round]
+        self._first_player_index = snapshot.first_player_index
+        self._current_player_index = snapshot.current_player_index
+        self._round_count = snapshot.round_count
+        self._declaration_phase = snapshot.declaration_phase
+        self._has_moved = list(snapshot.has_moved)
+        self._pig_effect, self._sheep_effect, self._doubler_effect, self._blood_effect = snapshot.effects
+        self._suit_rounds = dict(zip(SUITS, snapshot.suit_rounds))
+        self._scores = list(snapshot.scores)
+        self._history = [CARDS[value] for value in snapshot.history]
+        self._first_player_indices = list(snapshot.first_player_indices)
+        self._dealer.set_state(snapshot.dealer_state)
+        self._undo_stack = []
+        self._rebuild_observation()
+        # Snapshots edited by hand, e.g. determinizations, leave the hash out
+        self._hash = snapshot.zobrist_hash if snapshot.zobrist_hash is not None \
+            else self.compute_hash()
+
+    # Pickled as its options, players, packed snapshot and the state of
+    # its generator. Observation buffers are rebuilt and the undo stack
+    # is dropped, as in restore. Listeners are not pickled
+    def __getstate__(self):
+        return {"options": (self._render_mode, self._enable_declaration, self._n_players,
+                            self._flat_observations, self._skip_forced_moves,
+                            self._fast_forward, self._headless),
+                "id": self._id,
+                "players": self._players,
+                "snapshot": pack_snapshot(self.snapshot()) if self._players else None,
+                "dealer_state": self._dealer.get_state(),
+                "rng_state": self.np_random.bit_generator.state,
+                "forced_moves": self._forced_moves}
+
+    def __setstate__(self, state):
+        self.__init__(*state["options"])
+        self._id = state["id"]
+        self._players = state["players"]
+        if state["snapshot"] is not None:
+            self.restore(unpack_snapshot(state["snapshot"], state["dealer_state"]))
+        else:
+            self._dealer.set_state(state["dealer_state"])
+        self.np_random.bit_generator.state = state["rng_state"]
+        self._forced_moves = state["forced_moves"]
+
+    # Rebuild all observation buffers from the players and the history
+    def _rebuild_observation(self) -> None:
+        masks = np.array([[player.get_hand().mask,
+                           player.get_collected_cards().mask,
+                           player.get_played_cards().mask,
+                           player.get_current_played_card().mask]
+                          for player in self._players], dtype=np.uint64)
+        vectors = masks_to_vectors(masks)
+        self._agent_obs[:4] = vectors[0]
+        self._players_obs[:, :3] = vectors[1:, 1:]
+        self._observe_declarations()
+        self._history_obs.fill(0)
+        self._history_obs[np.arange(len(self._history)),
+                          [card.value for card in self._history]] = 1
+        self._first_player_obs.fill(0)
+        self._first_player_obs[:len(self._first_player_indices)] = self._first_player_indices
+        self._scores_obs[:] = self._scores
+
+    # Position of the card play with all hands visible, for the endgame solver
+    def endgame_position(self) -> EndgamePosition:
+        open_declared = 0
+        for card, effect, _ in _OPEN_DECLARATION_RULES:
+            if getattr(self, effect) >= 4.0:
+                open_declared |= card.mask
+        closed_declared, revealed = self._declaration_masks()
+        return EndgamePosition(
+            hands=tuple(player.get_hand().mask for player in self._players),
+            collected=tuple(player.get_collected_cards().mask for player in self._players),
+            round_cards=tuple(card.value for card in self._playedCardsThisRound),
+            leader=self._first_player_index,
+            round_count=self._round_count,
+            effects=self.effects(),
+            open_declared=open_declared,
+            closed_declared=closed_declared,
+            revealed=revealed,
+            led_suits=self._led_suits())
+
+    # Masks of the closed declarations of the given seats (all by default)
+    # and of those revealed so far
+    def _declaration_masks(self, seats : List[int] = None) -> Tuple[int, int]:
+        closed_declared = revealed = 0
+        for index in range(len(self._players)) if seats is None else seats:
+            for declaration in self._players[index].get_declarations().closed_declarations:
+                closed_declared |= declaration["card"].mask
+                if declaration["revealed"]:
+                    revealed |= declaration["card"].mask
+        return closed_declared, revealed
+
+    # Suits of which a round was completed, as a mask of suit indices
+    def _led_suits(self) -> int:
+        return sum(1 << i for i, suit in enumerate(SUITS) if self._suit_rounds[suit] > 0)
+
+    # Replace the declarations of a player
+    def _set_declarations(self, index : int, declarations : Declaration) -> None:
+        self._hash ^= declarations_key(*self._declaration_masks([index]))
+        self._players[index].set_declarations(declarations)
+        self._hash ^= declarations_key(*self._declaration_masks([index]))
+
+    # 64-bit Zobrist hash of the position: location of every card,
+    # cards of the round in progress, leader, effects, phase, closed
+    # declarations and suits led
+    def zobrist_hash(self) -> int:
+        return self._hash
+
+    # Hash of the position computed from scratch
+    def compute_hash(self) -> int:
+        key = 0
+        for index, player in enumerate(self._players):
+            key ^= mask_key(HAND_KEYS[index], player.get_hand().mask)
+            key ^= mask_key(PLAYED_KEYS[index], player.get_played_cards().mask)
+            key ^= mask_key(COLLECTED_KEYS[index], player.get_collected_cards().mask)
+        for card in self._playedCardsThisRound:
+            key ^= ROUND_KEYS[card.value]
+        key ^= leader_key(self._first_player_index)
+        key ^= effects_key(self.effects())
+        if self._declaration_phase:
+            key ^= DECLARATION_PHASE_KEY
+        key ^= declarations_key(*self._declaration_masks())
+        key ^= led_suits_key(self._led_suits())
+        return key
+
+    # A card goes from the hand of a player to the round in progress,
+    # revealing it if it was a closed declaration. Applying it twice reverts it
+    def _hash_move(self, index : int, card : Card, revealing : bool) -> None:
+        value = card.value
+        self._hash ^= HAND_KEYS[index][value] ^ PLAYED_KEYS[index][value] ^ ROUND_KEYS[value]
+        if revealing:
+            self._hash ^= REVEALED_KEYS[value]
+
+    # The cards of the round go to the collected cards of the largest player
+    def _hash_round(self, largest_index : int, played_cards : List[Card]) -> None:
+        for card in played_cards:
+            self._hash ^= ROUND_KEYS[card.value] ^ COLLECTED_KEYS[largest_index][card.value]
+
+    # Play a card for the current player without asking any policy,
+    # and collect the round if it is complete. The card must be legal.
+    # Every change is recorded so that undo_move can revert it, which
+    # lets a search walk the game tree without copying states.
+    def apply_move(self, card : Card) -> None:
+        assert not self._declaration_phase, "Cannot apply a move in the declaration phase"
+        # Moves of a search are not events, see events.py
+        listeners, self._listeners = self._listeners, {}
+        try:
+            index = self._current_player_index
+            player = self._players[index]
+            old_effects = self.effects()
+            revealing = player.get_declarations().is_unrevealed(card)
+            # Same order of updates as play_selected_card
+            if card in SPECIAL_CARDS:
+                self.update_effects()
+            self._playedCardsThisRound.append(card)
+            player.play_specific_card(card)
+            has_moved = self._has_moved[index]
+            self._has_moved[index] = True
+            self._current_player_index = (index + 1) % self._n_players
+            self.add_history(card)
+            self._observe_move(index, card)
+            self._hash_move(index, card, revealing)
+            round_record = None
+            if len(self._playedCardsThisRound) == self._n_players:
+                round_record = (self._playedCardsThisRound, self._first_player_index, tuple(self._has_moved))
+                self.next_round()
+            self._undo_stack.append((index, card, revealing, has_moved, old_effects, round_record))
+        finally:
+            self._listeners = listeners
+
+    # Revert the last apply_move
+    def undo_move(self) -> None:
+        index, card, revealing, has_moved, old_effects, round_record = self._undo_stack.pop()
+        if round_record is not None:
+            self._undo_round(*round_record)
+        self._players[index].take_back_card(card, conceal=revealing)
+        self._playedCardsThisRound.pop()
+        self._history.pop()
+        self._has_moved[index] = has_moved
+        self._current_player_index = index
+        self._unobserve_move(index, card)
+        self._hash_move(index, card, revealing)
+        self._set_effects(old_effects)
+
+    # Revert next_round
+    def _undo_round(self, played_cards : List[Card], first_player_index : int, has_moved : tuple) -> None:
+        self._round_count -= 1
+        largest_index = (first_player_index + self.find_largest_index(played_cards)) % self._n_players
+        self._players[largest_index].remove_collected_cards(played_cards)
+        self._update_score(largest_index)
+        suit = played_cards[0].get_suit()
+        self._suit_rounds[suit] -= 1
+        if self._suit_rounds[suit] == 0:
+            self._hash ^= LED_SUIT_KEYS[SUIT_INDEX[suit]]
+        # The first player of the next round is only added if the game goes on
+        if len(self._first_player_indices) > self._round_count + 1:
+            self._first_player_indices.pop()
+            self._first_player_obs[self._round_count + 1] = 0
+        obs, row = self._seat_obs(largest_index)
+        for i, card in enumerate(played_cards):
+            player_index = (first_player_index + i) % self._n_players
+            self._players[player_index].set_current_played_card(card)
+            obs[row, card.value] = 0
+            player_obs, player_row = self._seat_obs(player_index)
+            player_obs[player_row + 2, card.value] = 1
+        self._hash_round(largest_index, played_cards)
+        self._hash ^= leader_key(self._first_player_index) ^ leader_key(first_player_index)
+        self._playedCardsThisRound = played_cards
+        self._first_player_index = first_player_index
+        self._has_moved = list(has_moved)
+
+    def _set_effects(self, effects : Effects) -> None:
+        if effects != self.effects():
+            self._hash ^= effects_key(self.effects()) ^ effects_key(effects)
+            self._pig_effect, self._sheep_effect, self._doubler_effect, self._blood_effect = effects
+            for index in range(len(self._players)):
+                self._update_score(index)
+
+    # Observation as views of the buffers owned by the env, without
+    # any allocation. They are overwritten as the game goes on, so copy
+    # them to keep a state. Wrap them with torch.from_numpy to share
+    # the memory with tensors. Only the first history_length rows of
+    # history are filled.
+    def to_buffers(self) -> dict:
+        return {"agent_info": self._agent_obs,
+            "players_info": self._players_obs,
+            "history": self._history_obs,
+            "history_length": len(self._history),
+            "first_player_indices": self._first_player_obs,
+            "num_rounds": len(self._first_player_indices),
             "is_declaration_phase": self._declaration_phase,
-            "scores": np.array([player.get_score(self) for player in self._players])} 
+            "scores": self._scores_obs}
     
+    # Fixed-shape observation matching the observation space of flat mode
+    # History rows past history_length and first player indices of rounds
+    # not started yet are zero. The legal mask is empty when the agent
+    # cannot play a card (declaration phase or end of the game).
+    def to_flat_state(self) -> dict:
+        legal_mask = np.zeros(52, dtype=CARD_DTYPE)
+        if not self._declaration_phase and not self.is_end_episode():
+            legal_mask[:] = self.agent_legal_moves()
+        return {"agent_info": self._agent_obs.copy(),
+            "players_info": self._players_obs.copy(),
+            "history": self._history_obs.copy(),
+            "history_length": len(self._history),
+            "first_player_indices": self._first_player_obs.copy(),
+            "is_declaration_phase": int(self._declaration_phase),
+            "scores": self._scores_obs.copy(),
+            "legal_mask": legal_mask}
+
+    # Observation returned by reset and step
+    def _observation(self) -> dict:
+        return self.to_flat_state() if self._flat_observations else self.to_state()
+
+    # Compact form of a state returned by to_state, for rollout buffers
+    # Card vectors are bit-packed into 7 bytes each and the history is
+    # stored as card values. The last row of each players_info matrix
+    # holds a count rather than bits, so it is kept aside.
+    @staticmethod
+    def pack_state(state : dict) -> dict:
+        players_info = np.asarray(state["players_info"])
+        return {"agent_info": pack_vectors(state["agent_info"]),
+            "players_info": pack_vectors(players_info[:, :5]),
+            "num_unrevealed": players_info[:, 5, 0].copy(),
+            "history": np.array([card.value for card in state["history"]], dtype=np.uint8),
+            "first_player_indices": np.array(state["first_player_indices"], dtype=np.uint8),
+            "is_declaration_phase": state["is_declaration_phase"],
+            "scores": state["scores"]}
+
+    @staticmethod
+    def unpack_state(packed : dict) -> dict:
+        players_info = np.zeros((3, 6, 52), dtype=np.uint8)
+        players_info[:, :5] = unpack_vectors(packed["players_info"])
+        players_info[:, 5, 0] = packed["num_unrevealed"]
+        return {"agent_info": unpack_vectors(packed["agent_info"]),
+            "players_info": players_info,
+            "history": [CARDS[value] for value in packed["history"]],
+            "first_player_indices": packed["first_player_indices"].tolist(),
+            "is_declaration_phase": packed["is_declaration_phase"],
+            "scores": packed["scores"]}
+
     def is_declaration_phase(self):
         return self._declaration_phase
 
@@ -477,8 +1149,6 @@ class Gongzhu(gym.Env):
         return self._round_count >= self._max_rounds
 
     def to_dict(self) -> dict:
-        for player in self._players:
-            player.get_score(self)
         return {
             "id": self._id,
             "players": [player.to_dict() for player in self._players],
@@ -489,7 +1159,8 @@ class Gongzhu(gym.Env):
             "isEndEpisode": self.is_end_episode(),
             "history": [card.to_dict() for card in self._history],
             "firstPlayerIndices": self._first_player_indices,
-            "isDeclarationPhase": self._declaration_phase
+            "isDeclarationPhase": self._declaration_phase,
+            "forcedMoves": self._forced_moves
         }
     
     def get_game_state(self) -> dict:
@@ -528,15 +1199,23 @@ class Gongzhu(gym.Env):
 
     def get_played_cards_this_round(self) -> List[Card] :
         return self._playedCardsThisRound
+
+    # Cards played so far, in order
+    def get_history(self) -> List[Card]:
+        return self._history
+
+    # First player of each round started so far
+    def get_first_player_indices(self) -> List[int]:
+        return self._first_player_indices
     
     # Some functions related to scoring
     # @property
     def my_team_score(self) -> float:
-        return self._players[0].score(self) + self._players[2].score(self)
+        return self._scores[0] + self._scores[2]
     
     # @property
     def opponent_team_score(self):
-        return self._players[1].score(self) + self._players[3].score(self)
+        return self._scores[1] + self._scores[3]
     
     # @property
     def score_diff(self):
@@ -578,14 +1257,19 @@ class Gongzhu(gym.Env):
             game_info=self.to_state()
         )
 
-    def step(self, action: ActType) \
+    def step(self, action: ActType, forced : bool = False) \
         -> tuple[ObsType, SupportsFloat, bool, bool, dict[str, Any]]:
+        '''
+        Play the action of the agent, then the other players until its turn.
+        Callers that played the forced_move without asking a policy pass
+        forced=True, so that the move is counted in forced_moves.
+        '''
         # First, sanity check
         assert self._round_count < self._max_rounds, "More than max rounds"
         assert self.is_your_turn() , \
                 f"It's not your turn: player {self._current_player_index}"
 
-        if not self.is_declaration_phase():
+        if not self.is_declaration_phase() and not self._headless:
             assert action in self.legal_moves(self._players[self._current_player_index].get_hand(), self._playedCardsThisRound), \
                 f"Illegal move: {action} for player {self._current_player_index} \
                     Hand of player {self._current_player_index} is \
@@ -595,6 +1279,9 @@ class Gongzhu(gym.Env):
 
         score_diff = self.score_diff()
 
+        if forced:
+            self._forced_moves += 1
+
         if not self.is_declaration_phase():
             self.play_selected_card(action)
         else:
@@ -602,6 +1289,16 @@ class Gongzhu(gym.Env):
 
         self.play_until_your_turn()
 
+        if self._fast_forward and not self.is_end_episode():
+            scores = self.determined_scores()
+            if scores is not None:
+                # The final reward, without playing the rounds left
+                reward = scores[0] + scores[2] - scores[1] - scores[3]
+                if self._listeners:
+                    self._emit(EpisodeEndEvent(scores=tuple(scores), truncated=True))
+                return self._observation(), reward, False, True, \
+                    {"forced_moves": self._forced_moves, "final_scores": scores}
+
         new_score_diff = self.score_diff()
 
         # Reward is proportional to the change of advantage over the opponent team
@@ -613,28 +1310,33 @@ class Gongzhu(gym.Env):
             reward = new_score_diff
 
         # Return the new state, reward, and whether the game is over
-        return self.to_state(), reward, self.is_end_episode(), False, {}
+        return self._observation(), reward, self.is_end_episode(), False, \
+            {"forced_moves": self._forced_moves}
     
     def reset(self, ai_players : List[Player] = [], auto : bool = True,
         seed=None) -> ObsType:
         assert len(ai_players) == 0 or len(ai_players) == 4, "Please specify exactly four players. The first player is you."
-        # If the ai players are not specified, 
+        # If the ai players are not specified, the seats of the last game
+        # are kept, with their policies, and random players fill new envs
         if len(ai_players) == 0:
-            self._players = [
-                Player(id="You", name="You", avatar_url="avatar_url1", 
-                policy=RandomPolicy(env=self)),
-                Player(id="Panda", name="Panda", avatar_url="avatar_url2", 
-                policy=RandomPolicy(env=self)),
-                Player(id="Penguin", name="Penguin", avatar_url="avatar_url3",
-                policy=RandomPolicy(env=self)),
-                Player(id="Elephant", name="Elephant", avatar_url="avatar_url4",
-                policy=RandomPolicy(env=self)),
-            ]
+            if len(self._players) != self._n_players:
+                self._players = [
+                    Player(id="You", name="You", avatar_url="avatar_url1", 
+                    policy=RandomPolicy()),
+                    Player(id="Panda", name="Panda", avatar_url="avatar_url2", 
+                    policy=RandomPolicy()),
+                    Player(id="Penguin", name="Penguin", avatar_url="avatar_url3",
+                    policy=RandomPolicy()),
+                    Player(id="Elephant", name="Elephant", avatar_url="avatar_url4",
+                    policy=RandomPolicy()),
+                ]
         else:
             self._players =  ai_players
 
         if seed is not None:
-            Random.seed(seed)
+            # Seeds self.np_random, then restart the dealer from it
+            super().reset(seed=seed)
+            self._dealer.seed(self.np_random)
         
         # Reset player data (other than ratings)
         for player in self._players:
@@ -646,7 +1348,7 @@ class Gongzhu(gym.Env):
         if auto:
             self.play_until_your_turn()
 
-        return self.to_state(), {"enable_declaration": self._enable_declaration}
+        return self._observation(), {"enable_declaration": self._enable_declaration}
     
     # Maybe not need rn?
     def render(self, mode='human'):
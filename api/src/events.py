@@ -0,0 +1,66 @@
+# Events of a Gongzhu game
+# Observers subscribe a callback to an event type with Gongzhu.subscribe
+# and are called with each event as the game is played, so they can keep
+# their own state (beliefs, records, metrics) up to date in O(1) per
+# event instead of rescanning the game. Events are only built when some
+# callback is subscribed.
+#
+# Events follow the game played through reset, step and the policies.
+# The search tools apply_move, undo_move and restore emit nothing.
+from typing import Callable, NamedTuple, Tuple, TYPE_CHECKING
+from card import Card
+from scoring import Effects
+
+if TYPE_CHECKING:
+    from declaration import Declaration
+
+# Hands were dealt, at the start of a game
+class DealEvent(NamedTuple):
+    # Hand mask of each seat
+    hands : Tuple[int, ...]
+    # Seat leading the first round
+    first_player_index : int
+
+# A seat made its declarations
+class DeclarationEvent(NamedTuple):
+    seat : int
+    declaration : "Declaration"
+
+# A seat played a card to the round in progress
+class CardPlayedEvent(NamedTuple):
+    seat : int
+    card : Card
+    # Rounds completed before this one
+    round_count : int
+    # Position of the card in the round, 0 for the lead
+    position : int
+
+# A round is complete and its cards were collected by the winner
+class TrickWonEvent(NamedTuple):
+    winner : int
+    leader : int
+    # Cards of the round, starting with the leader's
+    cards : Tuple[Card, ...]
+    # Rounds completed, this one included
+    round_count : int
+    # Score of each seat after the collection
+    scores : Tuple[float, ...]
+
+# The multipliers (pig, sheep, doubler, blood) changed, after
+# declarations or when a closed declaration was revealed
+class EffectChangedEvent(NamedTuple):
+    old_effects : Effects
+    new_effects : Effects
+
+# The game is over
+class EpisodeEndEvent(NamedTuple):
+    # Final score of each seat
+    scores : Tuple[float, ...]
+    # True if the game was stopped early by fast_forward, once the
+    # remaining rounds could not change the scores
+    truncated : bool
+
+EVENT_TYPES = (DealEvent, DeclarationEvent, CardPlayedEvent,
+               TrickWonEvent, EffectChangedEvent, EpisodeEndEvent)
+
+Listener = Callable[[NamedTuple], None]
@@ -1,14 +1,38 @@
 # Vectorized version of the player class
 # By Yue Zhang, Feb 11, 2025
+import struct
 import numpy as np
-from card import Card, CardCollection, Hand, EMPTY_CARD, one_hot_vector
+from card import Card, CardCollection, Hand, CARDS, EMPTY_CARD, CARD_DTYPE, one_hot_vector
 from policy import Policy, RandomPolicy
 from typing import List, TYPE_CHECKING
 from gymnasium import Env
 from declaration import Declaration
 if TYPE_CHECKING:
     from env import Gongzhu
-    
+
+# Binary form of Player.snapshot: hand, collected and played masks, the
+# current card (-1 if none) and the numbers of closed and open
+# declarations, followed by one byte per declared card. The high bit of
+# a closed declaration byte tells whether it was revealed
+_STATE_HEADER = struct.Struct("<QQQbBB")
+_REVEALED_BIT = 0x80
+
+def pack_player_state(state : tuple) -> bytes:
+    """Packs a Player.snapshot into 27 bytes, plus one per declaration."""
+    hand, collected, played, current, closed, open_ = state
+    return _STATE_HEADER.pack(hand, collected, played, current, len(closed), len(open_)) \
+        + bytes(value | (_REVEALED_BIT if revealed else 0) for value, revealed in closed) \
+        + bytes(open_)
+
+def unpack_player_state(data : bytes) -> tuple:
+    """Inverse of pack_player_state."""
+    hand, collected, played, current, n_closed, n_open = _STATE_HEADER.unpack_from(data)
+    offset = _STATE_HEADER.size
+    closed = tuple((byte & ~_REVEALED_BIT, bool(byte & _REVEALED_BIT))
+                   for byte in data[offset:offset + n_closed])
+    open_ = tuple(data[offset + n_closed:offset + n_closed + n_open])
+    return (hand, collected, played, current, closed, open_)
+
 
 class Player:
     def __init__(self,
@@ -52,20 +76,71 @@ class Player:
         return self._score
 
     # reset player data
+    # Collections are emptied in place, so a player can be reused for
+    # many games without allocating
     def reset(self):
-        self._hand = Hand()
-        self._collectedCards = CardCollection()  
-        self._playedCards = CardCollection()  
-        self._currentPlayedCard : Card = Card()
+        self._hand.clear()
+        self._collectedCards.clear()
+        self._playedCards.clear()
+        self._currentPlayedCard : Card = EMPTY_CARD
 
         self._score = 0  
-        self._closeDeclaredCards = CardCollection() 
-        self._openDeclaredCards = CardCollection() 
-        self._declarations = Declaration()
+        self._closeDeclaredCards.clear()
+        self._openDeclaredCards.clear()
+        declarations = self._declarations
+        if declarations.closed_declarations or declarations.open_declarations:
+            self._declarations = Declaration()
+
+    # Take the policy and identity of another player, keeping the game
+    # data of this one, e.g. to seat pooled players in a new game
+    def take_seat_of(self, player : "Player"):
+        self.policy = player.policy
+        self.id = player.id
+        self.name = player.name
+        self.avatar_url = player.avatar_url
+        self.rating = player.rating
     
     def set_declarations(self, declarations : Declaration):
         self._declarations = declarations
 
+    # Compact copy of the game data of the player, see Gongzhu.snapshot
+    def snapshot(self) -> tuple:
+        declarations = self._declarations
+        return (self._hand.mask,
+                self._collectedCards.mask,
+                self._playedCards.mask,
+                self._currentPlayedCard.value,
+                tuple((declaration["card"].value, declaration["revealed"])
+                      for declaration in declarations.closed_declarations),
+                tuple(card.value for card in declarations.open_declarations))
+
+    # Restore the game data saved by snapshot
+    def restore(self, state : tuple):
+        hand, collected, played, current, closed, open_ = state
+        self._hand.set_mask(hand)
+        self._collectedCards.set_mask(collected)
+        self._playedCards.set_mask(played)
+        self._currentPlayedCard = CARDS[current] if current >= 0 else EMPTY_CARD
+        if closed or open_:
+            self._declarations = Declaration(
+                closed_declarations=[{"card": CARDS[value], "revealed": revealed}
+                                     for value, revealed in closed],
+                open_declarations=[CARDS[value] for value in open_])
+        else:
+            self._declarations = Declaration()
+
+    # Pickled as its identity, policy and packed game data, e.g. to send
+    # players to other processes
+    def __getstate__(self):
+        return (self.policy, self.id, self.name, self.avatar_url, self.rating,
+                self._score, pack_player_state(self.snapshot()))
+
+    def __setstate__(self, state):
+        policy, id, name, avatar_url, rating, score, data = state
+        self.__init__(policy=policy, id=id, name=name, avatar_url=avatar_url, rating=rating)
+        self._score = score
+        self.restore(unpack_player_state(data))
+
     def __repr__(self) -> str:
         return f"Player(id={self.id}, name={self.name}, avatar_url={self.avatar_url}, policy={self.policy}, rating={self.rating})"
     
@@ -166,6 +241,19 @@ class Player:
         self.add_card_to_played_cards(card)
         return self._hand.remove_card(card)
 
+    def take_back_card(self, card : Card, conceal : bool = False):
+        """
+        Revert play_specific_card.
+
+        :param card: The card to put back into the hand.
+        :param conceal: Whether playing the card revealed a closed declaration.
+        """
+        if conceal:
+            self._declarations.conceal(card)
+        self._currentPlayedCard = EMPTY_CARD
+        self._playedCards.remove_card(card)
+        self._hand.add_card(card)
+
     def duplicate(self):
         return Player(policy=self.policy, name=self.name, avatar_url=self.avatar_url, rating=self.rating)
 
@@ -186,6 +274,15 @@ class Player:
         for card in cards:
             self._collectedCards.add_card(card)
 
+    def remove_collected_cards(self, cards : List[Card]):
+        """
+        Remove multiple cards from the player's collected cards.
+        
+        :param cards: A list of cards to remove.
+        """
+        for card in cards:
+            self._collectedCards.remove_card(card)
+
     def get_collected_cards_size(self):
         """Get the size of the player's collected cards."""
         return self._collectedCards.size()
@@ -238,7 +335,7 @@ class Player:
         }
     
     # Vectorized (matrix) representation of a player
-    # Currently, it is a 52 x 6 matrix
+    # Currently, it is a 6 x 52 uint8 matrix
     @property
     def vec_full(self) -> np.array:
         return np.array( 
@@ -248,7 +345,7 @@ class Player:
             np.asarray(self._currentPlayedCard),
             np.asarray(CardCollection(self._declarations.get_all_closed_declarations())),
             np.asarray(CardCollection(self._declarations.get_open_declarations()))
-            ]
+            ], dtype=CARD_DTYPE
         )
 
     @property
@@ -261,7 +358,7 @@ class Player:
             np.asarray(CardCollection(self._declarations.get_revealed_closed_declarations())),
             np.asarray(CardCollection(self._declarations.get_open_declarations())),
             one_hot_vector(length=52, location=0) * self._declarations.num_unrevealed
-            ]
+            ], dtype=CARD_DTYPE
         )
 
 # Archaic version
@@ -2,4 +2,5 @@ from .policy import Policy
 from .random import RandomPolicy
 from .greedy import GreedyPolicy
 from .dmc import DMC
-from .mfe import ManualFeatureExtractor as MFE
\ No newline at end of file
+from .mfe import ManualFeatureExtractor as MFE
+from .ismcts import ISMCTSPolicy
\ No newline at end of file
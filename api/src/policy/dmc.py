@@ -60,6 +60,24 @@ def reshape_history_single(history, first_player_indices):
 
     return history_reshaped
 
+def reshape_history_buffer(history, history_length, first_player_indices):
+    """
+    reshape_history_single for the fixed-shape history of Gongzhu.to_buffers
+    and to_flat_state: 52 one-hot rows, of which history_length are filled,
+    and the first player of each round, 0 for rounds not started yet.
+    The arrays are read through torch.from_numpy, without copies.
+    """
+    if history_length == 0:
+        return torch.zeros(52, 4 * 52)
+    # Rows of cards not played yet are zero, so their argmax is 0 as well
+    card_indices = torch.argmax(torch.from_numpy(np.asarray(history)), dim=1)
+    first_player_indices = torch.from_numpy(np.asarray(first_player_indices, dtype=np.int64))
+    indices = (first_player_indices.unsqueeze(1) + torch.arange(4)).flatten() % 4
+
+    history_reshaped = torch.zeros(52, 4 * 52)
+    history_reshaped[torch.arange(52), (52 * indices) + card_indices] = 1
+    return history_reshaped
+
 def reshape_history(history, first_player_indices):
     """
     Converts a batch of history matrices into a batch of reshaped one-hot encoded representations.
@@ -75,7 +93,7 @@ def reshape_history(history, first_player_indices):
     batch_size = len(history)
 
     # Convert history to tensors and pad sequences
-    history_tensors = [torch.tensor(h, dtype=torch.float32) for h in history]  # Convert list to tensors
+    history_tensors = [torch.tensor(np.array(h), dtype=torch.float32) for h in history]  # Convert list to tensors
     padded_history = rnn_utils.pad_sequence(history_tensors, batch_first=True)  # (batch_size, max_seq_len, 52)
 
     # Convert first_player_indices to tensor
@@ -109,6 +127,7 @@ def reshape_history(history, first_player_indices):
     return history_reshaped
 
 class DMC(Policy):
+    reads_buffers = True
 
     def __init__(self, label : str = None, epsilon: float = 0.05, device: str = "cpu"):
         super().__init__(label=label, epsilon=epsilon)
@@ -129,14 +148,19 @@ class DMC(Policy):
         agent_info = game_info['agent_info']
         players_info = game_info['players_info']
         
-        history = reshape_history(history, first_player_indices) if batch else \
-                  reshape_history_single(history, first_player_indices)  
+        if batch:
+            history = reshape_history(history, first_player_indices)
+        elif "history_length" in game_info:
+            history = reshape_history_buffer(history, game_info["history_length"], first_player_indices)
+        else:
+            history = reshape_history_single(history, first_player_indices)
         # Output should be a 52 x 1 vector
+        # Share memory with the observation arrays instead of copying them
         out = self.model(history=history, 
-                        agent_info=torch.tensor(agent_info),
-                        player1_info=torch.tensor(players_info[0]),
-                        player2_info=torch.tensor(players_info[1]),
-                        player3_info=torch.tensor(players_info[2]))
+                        agent_info=torch.from_numpy(np.asarray(agent_info)),
+                        player1_info=torch.from_numpy(np.asarray(players_info[0])),
+                        player2_info=torch.from_numpy(np.asarray(players_info[1])),
+                        player3_info=torch.from_numpy(np.asarray(players_info[2])))
         return out
 
     def decide_action(self, 
@@ -146,6 +170,11 @@ class DMC(Policy):
         return_value: bool = False,
         batch : bool = False) -> Card:
 
+        if not return_value and not batch:
+            solved = self.solve_endgame(legal_moves, game_info)
+            if solved is not None:
+                return solved
+
         out = self.forward(game_info, batch=batch)
 
         # In return value mode, we can directly return a vector
@@ -159,11 +188,11 @@ class DMC(Policy):
         # # Filter out legal moves
         # out = legal_moves * out 
 
-        # out = torch.from_numpy(legal_moves) * out.detach().numpy()
+        # out = torch.from_numpy(np.asarray(legal_moves)) * out.detach().numpy()
         # Softmax output
         out = torch.softmax(out, dim=0)
         # Filter out legal moves
-        out = torch.from_numpy(legal_moves) * out
+        out = torch.from_numpy(np.asarray(legal_moves)) * out
         # Choose the best move
         action = torch.argmax(out)
 
@@ -16,6 +16,10 @@ class GreedyPolicy(Policy):
         legal_moves: CardCollection,
         game_info: dict = None) -> Card:
 
+        solved = self.solve_endgame(legal_moves, game_info)
+        if solved is not None:
+            return solved
+
         # Sometimes play a random card
         if random() <= self.epsilon:
             return legal_moves.get_one_random_card()
@@ -0,0 +1,212 @@
+from typing import Dict, List, Tuple, TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
+import math
+import time
+import numpy as np
+from card import Card, CardCollection, CARDS, mask_to_values
+from declaration import Declaration
+from determinization import InformationSet, DeterminizationSampler, information_set, determinize
+from policy import Policy
+
+if TYPE_CHECKING:
+    from env import Gongzhu, GongzhuSnapshot
+
+# Information set Monte Carlo tree search (single observer)
+# Every iteration samples the hidden hands consistent with what the
+# player has seen, descends one shared tree of moves among those legal in
+# that deal, and plays the rest of the game with a rollout policy.
+# Simulations run in a private Gongzhu restored from snapshots, never in
+# the game being played.
+class _Node:
+    __slots__ = ("mover", "children", "visits", "total", "available")
+
+    def __init__(self, mover : int = -1):
+        # Seat that played the move leading to this node
+        self.mover = mover
+        self.children : Dict[int, "_Node"] = {}
+        self.visits = 0
+        # Sum of the final score differences for the team of the mover
+        self.total = 0.0
+        # Number of times the move was legal when its parent was visited
+        self.available = 0
+
+class ISMCTSPolicy(Policy):
+    """
+    :param time_budget: Seconds of search per decision, None for no limit.
+    :param simulations: Simulations per decision (per worker), None for
+        no limit. At least one of the budgets must be set.
+    :param rollout_policy: Policy playing the simulated games to the end,
+        e.g. GreedyPolicy or a DMC / MFE model. None plays random moves.
+    :param exploration: UCB exploration constant, in points.
+    :param workers: Processes searching independent trees from the root,
+        whose statistics are summed.
+    :param seed: Seed of the determinizations and random rollouts.
+    """
+    def __init__(self, label : str = "ISMCTS", epsilon : float = 0,
+                 time_budget : float = 1.0, simulations : int = None,
+                 rollout_policy : Policy = None, exploration : float = 100.0,
+                 workers : int = 1, seed : int = None):
+        super().__init__(label=label, epsilon=epsilon)
+        assert time_budget is not None or simulations is not None, "A search budget is required"
+        self.time_budget = time_budget
+        self.simulations = simulations
+        self.rollout_policy = rollout_policy
+        self.exploration = exploration
+        self.workers = workers
+        self.rng = np.random.default_rng(seed)
+        self._sampler = None
+        self._env = None
+        self._executor = None
+        # Simulations run by the last decision, over all workers
+        self.last_simulations : int = 0
+
+    def decide_action(self,
+        legal_moves: CardCollection,
+        game_info: dict = None) -> Card:
+        if len(legal_moves) == 1:
+            return legal_moves[0]
+        solved = self.solve_endgame(legal_moves, game_info)
+        if solved is not None:
+            return solved
+        env : "Gongzhu" = game_info["env"]
+        seat = env.get_current_player_index()
+        snapshot = env.snapshot()
+        info = information_set(env, seat)
+        if self.workers > 1:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_worker,
+                    initargs=(self.rollout_policy, self.exploration))
+            seeds = self.rng.integers(1 << 32, size=self.workers)
+            futures = [self._executor.submit(_search_task, snapshot, info, self.time_budget,
+                                             self.simulations, int(seed)) for seed in seeds]
+            results = [future.result() for future in futures]
+        else:
+            results = [self.search(snapshot, info, self.time_budget, self.simulations)]
+        visits : Dict[int, int] = {}
+        for result in results:
+            for value, (count, _) in result.items():
+                visits[value] = visits.get(value, 0) + count
+        self.last_simulations = sum(visits.values())
+        legal_values = [card.value for card in legal_moves]
+        return CARDS[max(legal_values, key=lambda value: visits.get(value, 0))]
+
+    def decide_declarations(self,
+        hand: CardCollection,
+        game_info: dict = None) -> Declaration:
+        if self.rollout_policy is not None:
+            return self.rollout_policy.decide_declarations(hand, game_info)
+        return Declaration()
+
+    def search(self, snapshot : "GongzhuSnapshot", info : InformationSet,
+               time_budget : float = None, simulations : int = None) -> Dict[int, Tuple[int, float]]:
+        '''
+        Search from a snapshot of a game, seen by the seat of `info`.
+
+        :return: Visits and total score difference of each root move.
+        '''
+        if self._sampler is None:
+            self._sampler = DeterminizationSampler(seed=int(self.rng.integers(1 << 32)))
+        env = self._simulation_env()
+        deadline = time.perf_counter() + time_budget if time_budget is not None else math.inf
+        root = _Node()
+        count = 0
+        # Deals are sampled in batches, which is much faster per deal
+        batch = 64 if simulations is None else min(64, simulations)
+        deals = []
+        while (simulations is None or count < simulations) and time.perf_counter() < deadline:
+            if not deals:
+                deals = list(self._sampler.sample(info, batch))
+            env.restore(determinize(snapshot, info.seat, deals.pop(), self.rng))
+            self._iterate(env, root)
+            count += 1
+        return {value: (child.visits, child.total) for value, child in root.children.items()}
+
+    def _simulation_env(self) -> "Gongzhu":
+        if self._env is None:
+            from env import Gongzhu
+            from player import Player
+            from policy import RandomPolicy
+            self._env = Gongzhu()
+            self._env.reset(ai_players=[Player(id=str(i), name=str(i), policy=RandomPolicy())
+                                        for i in range(4)], auto=False)
+        return self._env
+
+    def _legal_mask(self, env : "Gongzhu") -> int:
+        from env import legal_move_mask
+        lead_suit = env.lead_suit_index(env.get_played_cards_this_round())
+        hand = env.get_player_by_index(env.get_current_player_index()).get_hand()
+        return legal_move_mask(hand.mask, lead_suit, env.blocked_mask())
+
+    def _iterate(self, env : "Gongzhu", root : _Node) -> None:
+        node = root
+        path : List[_Node] = []
+        # Selection and expansion
+        while not env.is_end_episode():
+            mover = env.get_current_player_index()
+            legal = mask_to_values(self._legal_mask(env))
+            untried = [value for value in legal if value not in node.children]
+            for value in legal:
+                child = node.children.get(value)
+                if child is not None:
+                    child.available += 1
+            if untried:
+                value = untried[self.rng.integers(len(untried))]
+                child = node.children[value] = _Node(mover)
+                child.available = 1
+                env.apply_move(CARDS[value])
+                path.append(child)
+                break
+            value, child = max(((value, node.children[value]) for value in legal),
+                               key=lambda item: self._ucb(item[1]))
+            env.apply_move(CARDS[value])
+            path.append(child)
+            node = child
+        self._rollout(env)
+        diff = env.score_diff()
+        for node in path:
+            node.visits += 1
+            node.total += diff if node.mover % 2 == 0 else -diff
+
+    def _ucb(self, node : _Node) -> float:
+        return node.total / node.visits \
+            + self.exploration * math.sqrt(math.log(node.available) / node.visits)
+
+    def _rollout(self, env : "Gongzhu") -> None:
+        while not env.is_end_episode():
+            if self.rollout_policy is None:
+                legal = mask_to_values(self._legal_mask(env))
+                card = CARDS[legal[self.rng.integers(len(legal))]]
+            else:
+                player = env.get_player_by_index(env.get_current_player_index())
+                card = self.rollout_policy.decide_action(
+                    legal_moves=env.legal_moves(player.get_hand(), env.get_played_cards_this_round()),
+                    game_info=env.to_buffers() if self.rollout_policy.reads_buffers else env.to_state())
+            env.apply_move(card)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    # The pool and the simulation env are not sent to other processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_env"] = None
+        return state
+
+    def __str__(self):
+        return "ISMCTSPolicy"
+
+# Search of the worker processes, set up once per process
+_worker_policy : ISMCTSPolicy = None
+
+def _init_worker(rollout_policy : Policy, exploration : float) -> None:
+    global _worker_policy
+    _worker_policy = ISMCTSPolicy(rollout_policy=rollout_policy, exploration=exploration)
+
+def _search_task(snapshot, info, time_budget, simulations, seed) -> Dict[int, Tuple[int, float]]:
+    _worker_policy.rng = np.random.default_rng(seed)
+    _worker_policy._sampler = None
+    return _worker_policy.search(snapshot, info, time_budget, simulations)
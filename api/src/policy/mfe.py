@@ -2,14 +2,14 @@
 # In order to shrink the state space
 # And accelerate training
 from typing import List, TYPE_CHECKING
-from card import Card, CardCollection
+from card import Card, CardCollection, RANKS
 from card import PIG, SHEEP, DOUBLER, PIGPEN, BLOOD, HEARTSUITE, SHEEPPEN, DOUBLERCATCHER
 from declaration import Declaration
 from random import random
 import numpy as np
 from policy import Policy
 from policy.models import GongzhuMFE
-from policy.dmc import reshape_history, reshape_history_single
+from policy.dmc import reshape_history, reshape_history_single, reshape_history_buffer
 import torch.nn.utils.rnn as rnn_utils
 import torch
 
@@ -24,6 +24,7 @@ def state_transformation(states):
     return new_states
 
 class ManualFeatureExtractor(Policy):
+    reads_buffers = True
 
     def __init__(self, label : str = "MFE",
                 epsilon: float = 0.05,
@@ -40,12 +41,18 @@ class ManualFeatureExtractor(Policy):
         # Extract relevant features from game_info
         # Return a tensor of shape (n_features)
         # First, extract the four 
-        features = np.zeros(self.n_features)
+        features = np.zeros(self.n_features, dtype=np.float32)
         history = game_info['history']
         first_player_indices = game_info['first_player_indices']
         agent_info = game_info['agent_info']
         players_info = game_info['players_info']
         scores = game_info['scores']
+        # Values of the cards played, from the cards of to_state or the
+        # one-hot rows of to_buffers and to_flat_state
+        if "history_length" in game_info:
+            values = np.asarray(history)[:game_info["history_length"]].argmax(axis=1)
+        else:
+            values = [card.value for card in history]
         # General features
         # Cards have been played in this game
         features[:52] = np.sum(history)
@@ -64,10 +71,10 @@ class ManualFeatureExtractor(Policy):
         features[468:520] = players_info[2][1]
         B = 520
         # See if the four special cards have been played
-        features[B + 0] = self.hasPlayedTheCard(PIG, history)
-        features[B + 1] = self.hasPlayedTheCard(SHEEP, history)
-        features[B + 2] = self.hasPlayedTheCard(DOUBLER, history)
-        features[B + 3] = self.hasPlayedTheCard(BLOOD, history)
+        features[B + 0] = PIG.value in values
+        features[B + 1] = SHEEP.value in values
+        features[B + 2] = DOUBLER.value in values
+        features[B + 3] = BLOOD.value in values
         # Number of cards played in each suit
         features[B + 4] = np.sum(features[:13])
         features[B + 5] = np.sum(features[13:26])
@@ -85,15 +92,15 @@ class ManualFeatureExtractor(Policy):
         # And if they have started a suit
         first_player_index = first_player_indices[0]
         current_suit = None
-        for index, h in enumerate(history):
-            card : Card = h.view(Card)
+        for index, value in enumerate(values):
             first_player_index = first_player_indices[index // 4]
             this_player_index = (first_player_index + index) % 4
+            suit = value // len(RANKS)
             if index % 4 == 0:
-                current_suit = card.suit
-                features[B + 16 + this_player_index * 4 + (card.value // 4)] = 1
-            elif card.suit != current_suit:
-                features[B + this_player_index * 4 + (card.value // 4)] = 1
+                current_suit = suit
+                features[B + 16 + this_player_index * 4 + (value // 4)] = 1
+            elif suit != current_suit:
+                features[B + this_player_index * 4 + (value // 4)] = 1
         for j in range(4):
             if features[524 + j] >= 13:
                 for i in range(4):  
@@ -111,7 +118,7 @@ class ManualFeatureExtractor(Policy):
         B = B + 6
         # Some misc information
         # Whether the agent has pigpens
-        agent_hand : CardCollection = agent_info[0].view(CardCollection)
+        agent_hand : CardCollection = CardCollection(agent_info[0])
         if agent_hand.intersect(PIGPEN) is not None:
             features[B + 0] = 1
         if agent_hand.intersect(SHEEPPEN) is not None:
@@ -138,6 +145,11 @@ class ManualFeatureExtractor(Policy):
         batch : bool = False,
         return_probs : bool = False) -> Card:
 
+        if not return_value and not batch:
+            solved = self.solve_endgame(legal_moves, game_info)
+            if solved is not None:
+                return solved
+
         out = self.forward(game_info, batch=batch)
         # print(out)
         # In return value mode, we can directly return a vector
@@ -155,11 +167,11 @@ class ManualFeatureExtractor(Policy):
         # # Filter out legal moves
         # out = legal_moves * out 
 
-        # out = torch.from_numpy(legal_moves) * out.detach().numpy()
+        # out = torch.from_numpy(np.asarray(legal_moves)) * out.detach().numpy()
         # Softmax output
         out = torch.softmax(out, dim=0)
         # Filter out legal moves
-        out = torch.from_numpy(legal_moves) * out
+        out = torch.from_numpy(np.asarray(legal_moves)) * out
         # print(out)
         # Choose the best move
         action = torch.argmax(out)
@@ -192,8 +204,12 @@ class ManualFeatureExtractor(Policy):
         history = states['history']
         first_player_indices = states['first_player_indices']
         
-        history = reshape_history(history, first_player_indices) if batch else \
-                  reshape_history_single(history, first_player_indices)  
+        if batch:
+            history = reshape_history(history, first_player_indices)
+        elif "history_length" in states:
+            history = reshape_history_buffer(history, states["history_length"], first_player_indices)
+        else:
+            history = reshape_history_single(history, first_player_indices)
         
         features = self.extract_features(game_info) if not batch else \
             torch.stack([self.extract_features(info) for info in game_info])
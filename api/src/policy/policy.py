@@ -4,7 +4,7 @@ from typing import List, TYPE_CHECKING
 from abc import ABC, abstractmethod
 import numpy as np
 from declaration import Declaration
-from card import Card, CardCollection
+from card import Card, CardCollection, CARDS
 from card import PIG, SHEEP, DOUBLER, BLOOD, PIGPEN, SHEEPPEN, DOUBLERCATCHER
 from card import SAFESPADE, SAFECLUB, SAFEDIAMOND
 
@@ -14,14 +14,45 @@ if TYPE_CHECKING:
     
 
 class Policy(ABC):
+    # If True, decide_action is given the observation buffers of
+    # Gongzhu.to_buffers as game_info instead of the copies of to_state
+    reads_buffers : bool = False
+
     def __init__(self, label : str = None, epsilon: float = 0):
         # self.env = env
         self.epsilon = epsilon
         self.label = label
+        # Exact solver of the last rounds, off by default
+        self.endgame_solver = None
+        self.endgame_round : int = 13
     
     def trainer(self):
         pass
 
+    def use_endgame_solver(self, solver, from_round : int = 10) -> None:
+        '''
+        Play with `solver` once `from_round` rounds are over. It sees every
+        hand, through the "env" of game_info (Gongzhu.to_policy_state).
+        Pass None to turn it off.
+        '''
+        self.endgame_solver = solver
+        self.endgame_round = from_round
+
+    # Best card of the endgame solver, or None if it is off, not reached
+    # yet or out of budget
+    def solve_endgame(self, legal_moves: CardCollection, game_info: dict = None) -> Card:
+        if self.endgame_solver is None or game_info is None:
+            return None
+        env = game_info.get("env")
+        if env is None or env._round_count < self.endgame_round:
+            return None
+        if len(legal_moves) == 1:
+            return legal_moves[0]
+        result = self.endgame_solver.solve(env.endgame_position())
+        if not result.complete:
+            return None
+        return CARDS[result.best]
+
     @abstractmethod
     def decide_action(self, 
         legal_moves: CardCollection,
@@ -61,48 +92,23 @@ class Policy(ABC):
         pass
     
     def getDiamondsSmallerThanSheep(self, hand: CardCollection) -> CardCollection:
-        ret = CardCollection()
-        for card in SAFEDIAMOND:
-            if card in hand:
-                ret.add_card(card)
-        return ret
+        return hand.intersect(SAFEDIAMOND)
 
     def getClubsSmallerThanDoubler(self, hand: CardCollection) -> CardCollection:
-        ret = CardCollection()
-        for card in SAFECLUB:
-            if card in hand:
-                ret.add_card(card)
-        return ret
+        return hand.intersect(SAFECLUB)
 
     def getSpadesSmallerThanPig(self, hand: CardCollection) -> CardCollection:
-        ret = CardCollection()
-        for card in SAFESPADE:
-            if card in hand:
-                ret.add_card(card)
-        return ret
+        return hand.intersect(SAFESPADE)
 
+    # Cards are ordered by value, so "smaller" covers every lower suit too
     def getCardsSmallerThan(self, hand: CardCollection, card: Card) -> CardCollection:
-        ret = CardCollection()
-        for card_ in hand:
-            if card_ > card:
-                break
-            else:
-                ret.add_card(card_)
-        return ret
+        return CardCollection.from_mask(hand.mask & ((card.mask << 1) - 1))
     
     def getCardsLargerThan(self, hand: CardCollection, card: Card) -> CardCollection:
-        ret = CardCollection()
-        for card_ in hand:
-            if card_ > card:
-                ret.add_card(card_)
-        return ret
+        return CardCollection.from_mask(hand.mask & ~((card.mask << 1) - 1))
 
     def getCardsExcludingOneCard(self, hand: CardCollection, card: Card) -> CardCollection:
-        ret = CardCollection()
-        for card_ in hand:
-            if card_!= card:
-                ret.add_card(card_)
-        return ret
+        return CardCollection.from_mask(hand.mask & ~card.mask)
 
     def getCurrentLargest(self, played_cards: List[Card]) -> Card:
         # Return None if no card has been played yet
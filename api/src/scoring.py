@@ -0,0 +1,98 @@
+# Scoring kernel of Gongzhu
+# Only 16 cards affect the score: the pig, the sheep, the doubler and
+# the 13 hearts. They are packed into a 16-bit index (hearts in bits
+# 0-12, then pig, sheep and doubler), and the score of every index is
+# tabulated once per configuration of the declaration effects.
+import numpy as np
+from functools import lru_cache
+from typing import Tuple
+from card import PIG, SHEEP, DOUBLER, RANKS, SUIT_INDEX, vectors_to_masks
+
+# Multipliers of (pig, sheep, doubler, blood)
+Effects = Tuple[float, float, float, float]
+NO_EFFECTS : Effects = (1.0, 1.0, 1.0, 1.0)
+
+HEART_SCORES = np.array([0, 0, 0, 10, 10, 10, 10, 10, 10, 20, 30, 40, 50])
+ALL_HEARTS = (1 << len(RANKS)) - 1
+_HEART_SHIFT = SUIT_INDEX["heart"] * len(RANKS)
+_PIG_BIT = len(RANKS)
+_SHEEP_BIT = len(RANKS) + 1
+_DOUBLER_BIT = len(RANKS) + 2
+N_SCORING_INDICES = 1 << (len(RANKS) + 3)
+# Cards that change the score when collected
+SCORING_MASK = (ALL_HEARTS << _HEART_SHIFT) | PIG.mask | SHEEP.mask | DOUBLER.mask
+
+# Total value of the hearts in each 13-bit heart mask
+BLOOD_TOTALS = ((np.arange(ALL_HEARTS + 1)[:, None] >> np.arange(len(RANKS))) & 1) @ HEART_SCORES
+
+def scoring_index(collected_mask : int) -> int:
+    """Packs the scoring cards of a 52-bit mask into a 16-bit index."""
+    return (((collected_mask >> _HEART_SHIFT) & ALL_HEARTS)
+            | ((collected_mask >> PIG.value) & 1) << _PIG_BIT
+            | ((collected_mask >> SHEEP.value) & 1) << _SHEEP_BIT
+            | ((collected_mask >> DOUBLER.value) & 1) << _DOUBLER_BIT)
+
+def scoring_indices(collected_masks) -> np.ndarray:
+    """Vectorized scoring_index over an array of 52-bit masks."""
+    masks = np.asarray(collected_masks, dtype=np.uint64)
+    def bit(value):
+        return (masks >> np.uint64(value)) & np.uint64(1)
+    return ((masks >> np.uint64(_HEART_SHIFT)) & np.uint64(ALL_HEARTS)
+            | bit(PIG.value) << np.uint64(_PIG_BIT)
+            | bit(SHEEP.value) << np.uint64(_SHEEP_BIT)
+            | bit(DOUBLER.value) << np.uint64(_DOUBLER_BIT)).astype(np.intp)
+
+def score_formula(indices, effects) -> np.ndarray:
+    """
+    Scores of 16-bit scoring indices, broadcast against effects of
+    shape (4,) or (N, 4).
+    """
+    indices = np.asarray(indices)
+    effects = np.asarray(effects, dtype=np.float64)
+    pig_effect, sheep_effect, doubler_effect, blood_effect = np.moveaxis(effects, -1, 0)
+    hearts = indices & ALL_HEARTS
+    has_pig = (indices >> _PIG_BIT) & 1 == 1
+    has_sheep = (indices >> _SHEEP_BIT) & 1 == 1
+    has_doubler = (indices >> _DOUBLER_BIT) & 1 == 1
+    has_all_blood = hearts == ALL_HEARTS
+
+    score = np.where(has_pig, -100.0 * pig_effect, 0.0) \
+        + np.where(has_sheep, 100.0 * sheep_effect, 0.0) \
+        + np.where(has_all_blood, 1.0, -1.0) * BLOOD_TOTALS[hearts] * blood_effect
+    # Bonus if collected everything
+    score = score + np.where(has_pig & has_sheep & has_all_blood & has_doubler,
+                             200.0 * pig_effect, 0.0)
+    # Effect of doubler
+    doubler_alone = has_doubler & ~has_pig & ~has_sheep & (hearts == 0)
+    score = np.where(doubler_alone, score + 50 * doubler_effect,
+                     np.where(has_doubler, score * 2 * doubler_effect, score))
+    # Avoid returning -0.0
+    return score + 0.0
+
+@lru_cache(maxsize=128)
+def score_table(effects : Effects = NO_EFFECTS) -> np.ndarray:
+    """Scores of all 65536 scoring indices for one effect configuration."""
+    table = score_formula(np.arange(N_SCORING_INDICES), effects)
+    table.flags.writeable = False
+    return table
+
+def calc_score_mask(collected_mask : int, effects : Effects = NO_EFFECTS) -> float:
+    """Score of a single 52-bit collected mask."""
+    return float(score_table(tuple(effects))[scoring_index(collected_mask)])
+
+def calc_scores(collected, effects = NO_EFFECTS) -> np.ndarray:
+    """
+    Scores of a batch of collected cards.
+
+    :param collected: Either (N,) 52-bit masks or (N, 52) {0,1} vectors.
+    :param effects: One effect configuration (4,) or one per row (N, 4).
+    :return: (N,) float64 scores.
+    """
+    collected = np.asarray(collected)
+    if collected.ndim >= 2:
+        collected = vectors_to_masks(collected)
+    indices = scoring_indices(collected)
+    effects = np.asarray(effects, dtype=np.float64)
+    if effects.ndim == 1:
+        return score_table(tuple(effects.tolist()))[indices]
+    return score_formula(indices, effects)
@@ -0,0 +1,305 @@
+# Exact endgame solver of Gongzhu
+# With all hands known, the last rounds are solved by alpha-beta search
+# over bitmasks. Seats 0 and 2 maximize and seats 1 and 3 minimize the
+# final score of team 0 minus the score of team 1. Adjacent cards of
+# the same hand that cannot change the outcome are searched once, and
+# positions are cached in a transposition table keyed by Zobrist hashes.
+import time
+from typing import Dict, List, NamedTuple, Tuple
+from card import RANKS, SUIT_INDEX, SUIT_MASKS, ABOVE_MASKS, PIG, SHEEP, DOUBLER, BLOOD
+from env import EndgamePosition, legal_move_mask
+from scoring import HEART_SCORES, SCORING_MASK, score_table, scoring_index
+from zobrist import HAND_KEYS, COLLECTED_KEYS, ROUND_KEYS, LEADER_KEYS, LED_SUIT_KEYS, REVEALED_KEYS
+from zobrist import mask_key, effects_key, declarations_key, led_suits_key
+
+N_SEATS = 4
+
+_HEART_OFFSET = SUIT_INDEX["heart"] * len(RANKS)
+
+# Cards of the same class and adjacent in play are interchangeable:
+# special cards are alone in their class, hearts are grouped by score
+# and the other cards of a suit share one class
+def _score_class(value : int) -> int:
+    if value in (PIG.value, SHEEP.value, DOUBLER.value):
+        return -1 - value
+    if _HEART_OFFSET <= value < _HEART_OFFSET + len(RANKS):
+        return 100 + int(HEART_SCORES[value - _HEART_OFFSET])
+    return value // len(RANKS)
+_SCORE_CLASSES = tuple(_score_class(value) for value in range(52))
+
+# Special cards, in the order of the effects they control
+_EFFECT_CARDS = (PIG.mask, SHEEP.mask, DOUBLER.mask, BLOOD.mask)
+SPECIAL_MASK = PIG.mask | SHEEP.mask | DOUBLER.mask | BLOOD.mask
+
+# Flags of transposition table entries
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+class SolverTimeout(Exception):
+    pass
+
+class SolverResult(NamedTuple):
+    # Final team score difference, for the team of the player to move,
+    # of each legal card value
+    values : Dict[int, float]
+    best : int
+    nodes : int
+    # False if the budget ran out, in which case values are empty
+    complete : bool
+    elapsed : float
+
+class EndgameSolver:
+    """
+    Alpha-beta solver of the card play with perfect information.
+
+    :param time_budget: Seconds allowed per solve.
+    :param max_nodes: Nodes allowed per solve, None for no limit.
+    :param max_table_size: The transposition table is cleared past this size.
+    """
+    def __init__(self, time_budget : float = 0.1, max_nodes : int = None,
+                 max_table_size : int = 1 << 20):
+        self.time_budget = time_budget
+        self.max_nodes = max_nodes
+        self.max_table_size = max_table_size
+        # Entries stay valid across solves: the key covers the hands, the
+        # scoring cards collected, the round in progress, its leader, the
+        # suits led, the effects and the closed declarations, revealed or not
+        self._table : Dict[int, Tuple[float, int, int]] = {}
+        self.nodes : int = 0
+
+    def solve(self, position : EndgamePosition) -> SolverResult:
+        start = time.perf_counter()
+        self._setup(position)
+        self._deadline = start + self.time_budget
+        self._node_limit = self.max_nodes
+        if len(self._table) > self.max_table_size:
+            self._table.clear()
+        self.nodes = 0
+        seat = self._to_move()
+        values = {}
+        try:
+            for value, equivalents in self._root_moves(seat):
+                self._play(value)
+                result = self._search(-float("inf"), float("inf"))
+                self._unplay()
+                # Values are kept from the point of view of the player to move
+                result = result if seat % 2 == 0 else -result
+                for equivalent in equivalents:
+                    values[equivalent] = result
+        except SolverTimeout:
+            return SolverResult({}, -1, self.nodes, False, time.perf_counter() - start)
+        best = max(values, key=values.get)
+        return SolverResult(values, best, self.nodes, True, time.perf_counter() - start)
+
+    def _setup(self, position : EndgamePosition) -> None:
+        self._hands = list(position.hands)
+        self._collected = list(position.collected)
+        self._round_cards : List[int] = list(position.round_cards)
+        self._leader = position.leader
+        self._open_declared = position.open_declared
+        self._led_suits = position.led_suits
+        self._closed_declared = position.closed_declared
+        self._revealed = position.revealed
+        self._effects = tuple(position.effects)
+        self._table_scores = score_table(self._effects)
+        self._in_play = 0
+        for hand in self._hands:
+            self._in_play |= hand
+        for value in self._round_cards:
+            self._in_play |= 1 << value
+        self._undo : List[tuple] = []
+        key = effects_key(position.effects) ^ LEADER_KEYS[self._leader]
+        for seat in range(N_SEATS):
+            key ^= mask_key(HAND_KEYS[seat], self._hands[seat])
+            key ^= mask_key(COLLECTED_KEYS[seat], self._collected[seat] & SCORING_MASK)
+        for value in self._round_cards:
+            key ^= ROUND_KEYS[value]
+        key ^= led_suits_key(self._led_suits)
+        key ^= declarations_key(self._closed_declared, self._revealed)
+        self._key = key
+
+    def _to_move(self) -> int:
+        return (self._leader + len(self._round_cards)) % N_SEATS
+
+    def _final_value(self) -> float:
+        table, collected = self._table_scores, self._collected
+        return (table[scoring_index(collected[0])] + table[scoring_index(collected[2])]
+                - table[scoring_index(collected[1])] - table[scoring_index(collected[3])])
+
+    def _legal_mask(self, seat : int) -> int:
+        lead_suit = self._round_cards[0] // len(RANKS) if self._round_cards else -1
+        blocked = self._open_declared
+        for suit in range(len(SUIT_MASKS)):
+            if self._led_suits >> suit & 1:
+                blocked &= ~SUIT_MASKS[suit]
+        return legal_move_mask(self._hands[seat], lead_suit, blocked)
+
+    # Representatives of the legal moves, each with the cards equivalent to it
+    def _root_moves(self, seat : int) -> List[Tuple[int, List[int]]]:
+        moves = []
+        group = []
+        legal = self._legal_mask(seat)
+        while legal:
+            low = legal & -legal
+            value = low.bit_length() - 1
+            group.append(value)
+            if not self._is_redundant(value, legal):
+                moves.append((value, group))
+                group = []
+            legal ^= low
+        return moves
+
+    # A card is redundant if the next card in play of its suit is also
+    # a legal move of the same class, since both lead to the same values
+    def _is_redundant(self, value : int, legal : int) -> bool:
+        above = ABOVE_MASKS[value] & self._in_play
+        if above == 0:
+            return False
+        above &= -above
+        return bool(above & legal) and \
+            _SCORE_CLASSES[above.bit_length() - 1] == _SCORE_CLASSES[value]
+
+    def _moves(self, seat : int, first : int) -> List[int]:
+        moves = []
+        legal = self._legal_mask(seat)
+        remaining = legal
+        while remaining:
+            low = remaining & -remaining
+            value = low.bit_length() - 1
+            if not self._is_redundant(value, legal):
+                moves.append(value)
+            remaining ^= low
+        # Try the best move of the table first
+        if first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def _play(self, value : int) -> None:
+        seat = self._to_move()
+        bit = 1 << value
+        self._hands[seat] ^= bit
+        self._key ^= HAND_KEYS[seat][value] ^ ROUND_KEYS[value]
+        led_suits = self._led_suits
+        effects, revealed = self._effects, self._revealed
+        if bit & SPECIAL_MASK:
+            self._play_special(bit)
+        self._round_cards.append(value)
+        if len(self._round_cards) < N_SEATS:
+            self._undo.append((seat, value, led_suits, effects, revealed, None))
+            return
+        # Collect the round
+        round_cards = self._round_cards
+        lead_suit_mask = SUIT_MASKS[round_cards[0] // len(RANKS)]
+        largest = max(range(N_SEATS), key=lambda i: round_cards[i] if (1 << round_cards[i]) & lead_suit_mask else -1)
+        winner = (self._leader + largest) % N_SEATS
+        round_mask = 0
+        for card in round_cards:
+            round_mask |= 1 << card
+            self._key ^= ROUND_KEYS[card]
+            if (1 << card) & SCORING_MASK:
+                self._key ^= COLLECTED_KEYS[winner][card]
+        self._undo.append((seat, value, led_suits, effects, revealed,
+                           (round_cards, self._leader, winner, round_mask)))
+        self._collected[winner] |= round_mask
+        self._in_play &= ~round_mask
+        self._key ^= LEADER_KEYS[self._leader] ^ LEADER_KEYS[winner]
+        # As in Gongzhu, a suit counts as led once a round of it is complete
+        suit = round_cards[0] // len(RANKS)
+        if not led_suits >> suit & 1:
+            self._led_suits |= 1 << suit
+            self._key ^= LED_SUIT_KEYS[suit]
+        self._leader = winner
+        self._round_cards = []
+
+    # As in Gongzhu, playing a special card first applies the closed
+    # declarations revealed so far, then reveals the card if it was one
+    def _play_special(self, bit : int) -> None:
+        effects = tuple(2.0 if self._revealed & card else effect
+                        for card, effect in zip(_EFFECT_CARDS, self._effects))
+        self._set_effects(effects)
+        if bit & self._closed_declared & ~self._revealed:
+            self._revealed |= bit
+            self._key ^= REVEALED_KEYS[bit.bit_length() - 1]
+
+    def _set_effects(self, effects : tuple) -> None:
+        if effects != self._effects:
+            self._key ^= effects_key(self._effects) ^ effects_key(effects)
+            self._effects = effects
+            self._table_scores = score_table(effects)
+
+    def _unplay(self) -> None:
+        seat, value, led_suits, effects, revealed, collected_round = self._undo.pop()
+        if collected_round is not None:
+            round_cards, leader, winner, round_mask = collected_round
+            for card in round_cards:
+                self._key ^= ROUND_KEYS[card]
+                if (1 << card) & SCORING_MASK:
+                    self._key ^= COLLECTED_KEYS[winner][card]
+            self._collected[winner] &= ~round_mask
+            self._in_play |= round_mask
+            self._key ^= LEADER_KEYS[winner] ^ LEADER_KEYS[leader]
+            self._leader = leader
+            self._round_cards = round_cards
+        self._round_cards.pop()
+        for suit in range(len(SUIT_MASKS)):
+            if (self._led_suits ^ led_suits) >> suit & 1:
+                self._key ^= LED_SUIT_KEYS[suit]
+        self._led_suits = led_suits
+        self._set_effects(effects)
+        self._key ^= mask_key(REVEALED_KEYS, self._revealed ^ revealed)
+        self._revealed = revealed
+        self._hands[seat] |= 1 << value
+        self._key ^= HAND_KEYS[seat][value] ^ ROUND_KEYS[value]
+
+    def _search(self, alpha : float, beta : float) -> float:
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self._deadline:
+            raise SolverTimeout()
+        if self._node_limit is not None and self.nodes > self._node_limit:
+            raise SolverTimeout()
+        # Nothing left to win, the score is settled
+        if self._in_play & SCORING_MASK == 0:
+            return self._final_value()
+
+        key = self._key
+        entry = self._table.get(key)
+        first = -1
+        if entry is not None:
+            value, flag, first = entry
+            if flag == _EXACT:
+                return value
+            if flag == _LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        original_alpha, original_beta = alpha, beta
+        seat = self._to_move()
+        maximizing = seat % 2 == 0
+        best_value = -float("inf") if maximizing else float("inf")
+        best_move = -1
+        for move in self._moves(seat, first):
+            self._play(move)
+            value = self._search(alpha, beta)
+            self._unplay()
+            if maximizing:
+                if value > best_value:
+                    best_value, best_move = value, move
+                alpha = max(alpha, value)
+            else:
+                if value < best_value:
+                    best_value, best_move = value, move
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = _UPPER
+        elif best_value >= original_beta:
+            flag = _LOWER
+        else:
+            flag = _EXACT
+        self._table[key] = (best_value, flag, best_move)
+        return best_value
@@ -3,7 +3,7 @@ from card import Card, CardCollection
 from card import PIG, SHEEP, DOUBLER, PIGPEN, BLOOD
 from env import Gongzhu
 from player import Player
-from policy import Policy, RandomPolicy, GreedyPolicy, DMC, MFE
+from policy import Policy, RandomPolicy, GreedyPolicy, DMC, MFE, ISMCTSPolicy
 from typing import List, Tuple, Dict
 
 import threading
@@ -49,20 +49,29 @@ def update_ratings(players : List[Player], margin : float, indices, ratings, loc
         for i, index in enumerate(indices):
             ratings[index] = players[i].get_rating()
 
-def simulate(env : Gongzhu, players : List[Player], indices, ratings, lock):
+def simulate(env : Gongzhu, players : List[Player], indices, ratings, lock, seed : int = None,
+             seats : List[Player] = None):
     '''
     Simulate a game played by 4 players and update their elo ratings
+    If seats are given, these 4 players are reused to play the game
+    instead of duplicates of the players
     '''
     assert len(players) == 4, "You must have exactly 4 players"
-    _players =[player.duplicate() for player in players]
-    state, info = env.reset(ai_players=_players)
-    terminated = False
+    if seats is None:
+        _players = [player.duplicate() for player in players]
+    else:
+        _players = seats
+        for seat, player in zip(seats, players):
+            seat.take_seat_of(player)
+    state, info = env.reset(ai_players=_players, seed=seed)
+    terminated = truncated = False
     final_reward = None
-    while not terminated:
+    while not (terminated or truncated):
         action = _players[0].policy.decide_action(legal_moves = env.agent_legal_moves(), 
-                                                game_info=state)
-        state, reward, terminated, _, _ = env.step(action)
-        if terminated:
+                                                game_info=env.to_policy_state())
+        # Truncated once the final scores are settled, see Gongzhu.determined_scores
+        state, reward, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
             final_reward = reward
     # Update elo ratings
     update_ratings(players, margin=final_reward, indices=indices, ratings=ratings, lock=lock)
@@ -75,10 +84,13 @@ def calculate_player_statistics(players : List[Player]):
     std_dev = np.std(player_ratings)
     return player_ratings, mean_rating, std_dev
 
-def play(players : List[Player], num_simulations : int, iteration, ratings, same_agent, lock):
+def play(players : List[Player], num_simulations : int, iteration, ratings, same_agent, lock,
+         seed : int = None):
     global iteration_lock
     local_simulations = 0
-    env = Gongzhu()
+    env = Gongzhu(fast_forward=True)
+    # Players seated in every game of this process
+    seats = [Player() for _ in range(4)]
     while iteration.value < num_simulations:
         # Randomly choose 4 players 
         if same_agent:
@@ -92,7 +104,8 @@ def play(players : List[Player], num_simulations : int, iteration, ratings, same
         # Simulate the game
         final_reward = simulate(env=env, players=players_to_simulate, 
                                 indices=players_to_simulate_indices, ratings=ratings,
-                                lock=lock)
+                                lock=lock, seed=seed if local_simulations == 0 else None,
+                                seats=seats)
         # print(f"Final Reward: {final_reward}")
         # print(f"Players: {players_to_simulate}")
         with lock:
@@ -105,7 +118,7 @@ def play(players : List[Player], num_simulations : int, iteration, ratings, same
 
 def arena(policies : List[Policy], num_players : int,
           num_simulations : int, num_processes : int,
-          same_agent : bool = False):
+          same_agent : bool = False, seed : int = None):
     # Create players
     players_by_policies = [[Player(policy=policy) for _ in range(num_players_per_policy)] 
         for policy in policies]
@@ -121,7 +134,8 @@ def arena(policies : List[Policy], num_players : int,
     for i in range(num_processes):
         actor = ctx.Process(
             target=play,
-            args=(players, num_simulations, iteration, ratings, same_agent, lock)
+            args=(players, num_simulations, iteration, ratings, same_agent, lock,
+                  None if seed is None else seed + i)
         )
         actor_processes.append(actor)
 
@@ -180,6 +194,10 @@ if __name__ == "__main__":
                         help='Number of processes to simulate') 
     parser.add_argument('--same_agent', action='store_true', default=True,
                     help='Force teammates to have the same agent')
+    parser.add_argument('--seed', default=None, type=int,
+                    help='Seed for the deals of each simulation process')
+    parser.add_argument('--ismcts_time', default=None, type=float,
+                    help='Seconds of search per move of an ISMCTS agent, none if not set')
     args = parser.parse_args()
 
     # Hyperparameters
@@ -187,6 +205,7 @@ if __name__ == "__main__":
     num_simulations = args.num_simulations
     num_processes = args.num_processes
     same_agent = args.same_agent
+    seed = args.seed
     print(f"num_players_per_policy={num_players_per_policy}")
     print(f"num_simulations={num_simulations}")
     print(f"num_processes={num_processes}")
@@ -213,15 +232,21 @@ if __name__ == "__main__":
         )
         mfes_15e5[-1].load_state_dict(checkpoint_state)
 
+    search_policies = []
+    if args.ismcts_time is not None:
+        search_policies.append(ISMCTSPolicy(label="ISMCTS", time_budget=args.ismcts_time,
+                                            rollout_policy=greedy_policy))
+
     # Run the arena simulations
     arena(
         # policies=[random_policy, greedy_policy, dmc_1e6, mfe_15e5],
         policies=[random_policy, greedy_policy, dmc_1e6,
-            *mfes_15e5],
+            *mfes_15e5, *search_policies],
         num_players=num_players_per_policy,
         num_processes=num_processes,
         num_simulations=num_simulations,
-        same_agent=same_agent)
+        same_agent=same_agent,
+        seed=seed)
     # # Create players
     # random_players = [Player(policy=RandomPolicy()) for _ in range(num_players_per_policy)]
     # greedy_players = [Player(policy=GreedyPolicy(epsilon=0)) for _ in range(num_players_per_policy)]
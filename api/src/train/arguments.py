@@ -35,6 +35,10 @@ parser.add_argument('--exp_epsilon', default=0.01, type=float,
                     help='The probability for exploration')
 parser.add_argument('--batch_size', default=37, type=int,
                     help='Learner batch size')
+parser.add_argument('--drop_forced_moves', action='store_true',
+                    help='Leave moves with a single legal card out of the training samples')
+parser.add_argument('--fast_forward', action='store_true',
+                    help='End sampled games as soon as their final scores are settled')
 parser.add_argument('--unroll_length', default=100, type=int,
                     help='The unroll length (time dimension)')
 parser.add_argument('--num_buffers', default=50, type=int,
@@ -326,7 +326,9 @@ def train(flags : Flag):
 
             # Sampler episodes
             samples = sampler(n = flags.batch_size, models=default_actor_models,
-                              agent_policy=learner_model)
+                              agent_policy=learner_model,
+                              drop_forced_moves=flags.drop_forced_moves,
+                              fast_forward=flags.fast_forward)
             print(f"Sampler episodes took {timer() - start_time} seconds")
             # Train on the samples
             training_start_time = timer()
@@ -123,8 +123,20 @@ def create_buffers(flags : Flag, device_iterator):
         buffers[device] = _buffers
     return buffers
 
-def sampler(n : int, models : List[Policy], agent_policy: Policy):
-    env = Gongzhu()
+def sampler(n : int, models : List[Policy], agent_policy: Policy, seed : int = None,
+            pack_states : bool = False, drop_forced_moves : bool = False,
+            fast_forward : bool = False):
+    """
+    Play n episodes and record every step of the agent.
+    If pack_states is True, states are stored in the bit-packed form of
+    Gongzhu.pack_state and must be restored with Gongzhu.unpack_state.
+    Forced moves (a single legal card) are played without asking the agent
+    policy; if drop_forced_moves is True they are not recorded either, and
+    their reward and termination go to the previous record.
+    If fast_forward is True, episodes end as soon as the final scores are
+    settled (see Gongzhu.determined_scores), with the final reward.
+    """
+    env = Gongzhu(fast_forward=fast_forward)
     buffers = {
         "state" : [],
         "action" : [],
@@ -140,16 +152,27 @@ def sampler(n : int, models : List[Policy], agent_policy: Policy):
         records = []
         policies = [agent_policy, *np.random.choice(models, size=3, replace=False)]
         ai_players = [Player(policy=policy) for policy in policies]
-        state, info = env.reset(ai_players=ai_players)
+        # Seeding the first episode makes the whole sequence of deals reproducible
+        state, info = env.reset(ai_players=ai_players, seed=seed if i == 0 else None)
         final_reward = 0
         terminated = False
         round = 0
         while not terminated:
             legal_moves = env.agent_legal_moves()
-            action = agent_policy.decide_action(game_info=state, legal_moves=legal_moves)
-            next_state, reward, terminated, info, _ = env.step(action)
+            forced_move = env.forced_move()
+            action = forced_move if forced_move is not None else \
+                agent_policy.decide_action(game_info=state, legal_moves=legal_moves)
+            next_state, reward, terminated, truncated, info = env.step(
+                action, forced=forced_move is not None)
+            terminated = terminated or truncated
             state = next_state
             round += 1
+            if terminated:
+                final_reward = reward
+            if drop_forced_moves and forced_move is not None and records:
+                records[-1]["reward"] += reward
+                records[-1]["terminated"] = terminated
+                continue
             records.append({
                 "state": state,
                 "action": action,
@@ -158,11 +181,10 @@ def sampler(n : int, models : List[Policy], agent_policy: Policy):
                 "info": info,
                 "legal_moves": legal_moves
             })
-            if terminated:
-                final_reward = reward
 
         for record in records:
-            buffers["state"].append(record["state"])
+            buffers["state"].append(Gongzhu.pack_state(record["state"]) if pack_states
+                                    else record["state"])
             buffers["actions"].append(record["action"])
             buffers["reward"].append(record["reward"])
             buffers["final_reward"].append(final_reward)
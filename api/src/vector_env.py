@@ -0,0 +1,356 @@
+# Vectorized Gongzhu
+# N games are held as a structure of arrays (hand, collected and played
+# masks, the round in progress, first players and effects) and advanced
+# together with array operations. Every step, the player to move in each
+# game plays one card, so all games finish their rounds at the same step.
+# Declarations are not supported; every game is played without them.
+import numpy as np
+from gymnasium.spaces import Box, Dict, Discrete
+from gymnasium.utils import seeding
+from gymnasium.vector.utils import batch_space
+from typing import Any, Tuple
+from card import CARD_DTYPE, SUITE_SIZE, RANKS, SUIT_INDEX, SUIT_MASKS, masks_to_vectors
+from card import PIG, SHEEP, DOUBLER, PIGPEN, SAFESPADE, SAFECLUB, SAFEDIAMOND
+from env import Gongzhu, legal_move_masks, _OPEN_DECLARATION_RULES
+from dealer import deal_hands
+from scoring import scoring_indices, score_formula
+
+N_PLAYERS = 4
+MAX_ROUNDS = SUITE_SIZE // N_PLAYERS
+
+# Order of Gongzhu.effects()
+_EFFECT_INDEX = {"_pig_effect": 0, "_sheep_effect": 1, "_doubler_effect": 2, "_blood_effect": 3}
+_BLOCKING_RULES = [(np.uint64(card.mask), _EFFECT_INDEX[effect], suit_index)
+                   for card, effect, suit_index in _OPEN_DECLARATION_RULES]
+_ONE = np.uint64(1)
+_BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+def _byte_popcount(masks : np.ndarray) -> np.ndarray:
+    """Number of set bits of each uint64 mask, from a table of byte counts."""
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return _BYTE_COUNTS[masks.view(np.uint8).reshape(masks.shape + (8,))].sum(axis=-1, dtype=np.uint8)
+
+# np.bitwise_count only exists from NumPy 2.0
+_popcount = getattr(np, "bitwise_count", _byte_popcount)
+
+def _unpack_rows(masks : np.ndarray) -> np.ndarray:
+    """
+    masks_to_vectors without its final copy: the vectors are views of
+    64 unpacked bits per mask, whose last 12 are dropped.
+    """
+    bits = np.unpackbits(masks.view(np.uint8).reshape(-1), bitorder="little")
+    return bits.reshape(masks.shape + (64,))[..., :SUITE_SIZE]
+
+def random_actions(legal_mask : np.ndarray, rng : np.random.Generator) -> np.ndarray:
+    """
+    Pick one legal card uniformly at random in each game.
+
+    :param legal_mask: (N, 52) {0,1} legal action masks.
+    :return: (N,) card values.
+    """
+    # The legal card whose running count first exceeds a uniform pick
+    counts = np.asarray(legal_mask, dtype=np.uint8).cumsum(axis=1, dtype=np.uint8)
+    picks = (rng.random(len(counts)) * counts[:, -1]).astype(np.uint8)
+    return (counts > picks[:, None]).argmax(axis=1)
+
+class VectorGongzhu:
+    """
+    Synchronous batch of Gongzhu games, following the interface of
+    gymnasium's VectorEnv.
+
+    Actions are card values (0-51), one per game, played by the player
+    whose turn it is in that game (`current_player` in the observation).
+    Observations are seen from that player: `agent_info` and
+    `players_info` have the layout of Player.vec_full and vec_partial,
+    with the other players in playing order. Rewards are given to the
+    team of player 0, as in Gongzhu.step.
+
+    agent_info and players_info are views of one array of unpacked
+    bits, so they are not contiguous.
+
+    Games end after 52 steps and are reset automatically within the same
+    step; the terminal observation and scores are then found in
+    infos["final_observation"] and infos["final_scores"].
+    """
+    def __init__(self, num_envs : int, full_observations : bool = True, seed : int = None):
+        """
+        :param num_envs: Number of games played in parallel.
+        :param full_observations: If False, observations only contain the
+            current player, legal mask and scores, which is enough to play
+            with simple policies and much cheaper to build.
+        :param seed: Seed of the dealer.
+        """
+        self.num_envs : int = num_envs
+        self._full_observations : bool = full_observations
+        self.np_random, _ = seeding.np_random(seed)
+
+        single_observation_space = {
+            "current_player": Discrete(N_PLAYERS),
+            "legal_mask": Box(0, 1, shape=(SUITE_SIZE,), dtype=CARD_DTYPE),
+            "scores": Box(-np.inf, np.inf, shape=(N_PLAYERS,), dtype=np.float64),
+        }
+        if full_observations:
+            single_observation_space.update({
+                "agent_info": Box(0, 1, shape=(6, SUITE_SIZE), dtype=CARD_DTYPE),
+                "players_info": Box(0, MAX_ROUNDS, shape=(N_PLAYERS - 1, 6, SUITE_SIZE), dtype=CARD_DTYPE),
+                # Card values in playing order, -1 for cards not played yet
+                "history": Box(-1, SUITE_SIZE - 1, shape=(SUITE_SIZE,), dtype=np.int8),
+                # First player of each round, -1 for rounds not started yet
+                "first_player_indices": Box(-1, N_PLAYERS - 1, shape=(MAX_ROUNDS,), dtype=np.int8),
+            })
+        self.single_observation_space = Dict(single_observation_space)
+        self.single_action_space = Discrete(SUITE_SIZE)
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        n = num_envs
+        self._rows = np.arange(n)
+        # Masks of each seat
+        self._hands = np.zeros((n, N_PLAYERS), dtype=np.uint64)
+        self._collected = np.zeros((n, N_PLAYERS), dtype=np.uint64)
+        self._played = np.zeros((n, N_PLAYERS), dtype=np.uint64)
+        # Card played by each seat this round, -1 if none
+        self._round_cards = np.full((n, N_PLAYERS), -1, dtype=np.int64)
+        self._lead_suit = np.full(n, -1, dtype=np.int64)
+        self._current_player = np.zeros(n, dtype=np.int64)
+        self._history = np.full((n, SUITE_SIZE), -1, dtype=np.int8)
+        self._first_player_indices = np.full((n, MAX_ROUNDS), -1, dtype=np.int8)
+        # Multipliers of (pig, sheep, doubler, blood) and rounds led per suit
+        self._effects = np.ones((n, 4), dtype=np.float64)
+        self._suit_rounds = np.zeros((n, 4), dtype=np.int64)
+        self._scores = np.zeros((n, N_PLAYERS), dtype=np.float64)
+        self._legal = np.zeros(n, dtype=np.uint64)
+        # Rows of agent_info (seat 0) and players_info (seats 1-3) as masks
+        self._obs_masks = np.zeros((n, N_PLAYERS, 6), dtype=np.uint64)
+        # Cards played so far, identical in all games
+        self._n_played : int = 0
+
+    def reset(self, seed : int = None, options : dict = None) -> Tuple[dict, dict]:
+        if seed is not None:
+            self.np_random, _ = seeding.np_random(seed)
+        self._start()
+        return self._observe(), {}
+
+    def _start(self) -> None:
+        self._hands[:] = deal_hands(self.np_random, self.num_envs, N_PLAYERS)
+        self._collected.fill(0)
+        self._played.fill(0)
+        self._round_cards.fill(-1)
+        self._lead_suit.fill(-1)
+        self._history.fill(-1)
+        self._first_player_indices.fill(-1)
+        self._effects.fill(1.0)
+        self._suit_rounds.fill(0)
+        self._n_played = 0
+        # The player holding the two of spades goes first
+        first_card = np.uint64(Gongzhu.FIRST_CARD.value)
+        self._current_player[:] = ((self._hands >> first_card) & _ONE).argmax(axis=1)
+        self._first_player_indices[:, 0] = self._current_player
+        self._update_scores()
+        self._update_legal()
+
+    def step(self, actions) -> Tuple[dict, np.ndarray, np.ndarray, np.ndarray, dict]:
+        actions = np.asarray(actions, dtype=np.int64)
+        rows, seats = self._rows, self._current_player
+        bits = _ONE << actions.astype(np.uint64)
+        illegal = (self._legal & bits) == 0
+        if illegal.any():
+            raise ValueError(f"Illegal moves in games {np.flatnonzero(illegal).tolist()}: "
+                             f"{actions[illegal].tolist()}")
+        score_diff = self.score_diff()
+
+        self._hands[rows, seats] &= ~bits
+        self._played[rows, seats] |= bits
+        self._round_cards[rows, seats] = actions
+        self._history[:, self._n_played] = actions
+        if self._n_played % N_PLAYERS == 0:
+            self._lead_suit[:] = actions // len(RANKS)
+        self._n_played += 1
+        self._current_player = (seats + 1) % N_PLAYERS
+        if self._n_played % N_PLAYERS == 0:
+            self._next_round()
+
+        new_score_diff = self.score_diff()
+        done = self._n_played == SUITE_SIZE
+        # Same rewards as Gongzhu.step
+        rewards = new_score_diff if done else (new_score_diff - score_diff) / 10
+        terminations = np.full(self.num_envs, done)
+        truncations = np.zeros(self.num_envs, dtype=bool)
+        infos = {}
+        if done:
+            infos = {"final_observation": self._observe(),
+                     "final_scores": self._scores.copy(),
+                     "_final_observation": terminations.copy()}
+            self._start()
+        else:
+            self._update_legal()
+        return self._observe(), rewards, terminations, truncations, infos
+
+    def _next_round(self) -> None:
+        rows = self._rows
+        # The largest card of the lead suit wins the round
+        same_suit = self._round_cards // len(RANKS) == self._lead_suit[:, None]
+        winners = np.where(same_suit, self._round_cards, -1).argmax(axis=1)
+        round_mask = np.bitwise_or.reduce(_ONE << self._round_cards.astype(np.uint64), axis=1)
+        self._collected[rows, winners] |= round_mask
+        self._suit_rounds[rows, self._lead_suit] += 1
+        self._round_cards.fill(-1)
+        self._lead_suit.fill(-1)
+        self._current_player = winners
+        round_count = self._n_played // N_PLAYERS
+        if round_count < MAX_ROUNDS:
+            self._first_player_indices[:, round_count] = winners
+        self._update_scores()
+
+    def _update_scores(self) -> None:
+        self._scores = score_formula(scoring_indices(self._collected), self._effects[:, None])
+
+    def _blocked_masks(self) -> np.ndarray:
+        blocked = np.zeros(self.num_envs, dtype=np.uint64)
+        for mask, effect_index, suit_index in _BLOCKING_RULES:
+            is_blocked = (self._effects[:, effect_index] >= 4.0) & (self._suit_rounds[:, suit_index] == 0)
+            blocked |= np.where(is_blocked, mask, np.uint64(0))
+        return blocked
+
+    def _update_legal(self) -> None:
+        self._legal = legal_move_masks(self._hands[self._rows, self._current_player],
+                                       self._lead_suit, self._blocked_masks())
+
+    def score_diff(self) -> np.ndarray:
+        """Score of the team of player 0 minus the score of the other team."""
+        return self._scores[:, 0] + self._scores[:, 2] - self._scores[:, 1] - self._scores[:, 3]
+
+    def legal_masks(self) -> np.ndarray:
+        """Legal moves of the current player of each game, as 52-bit masks."""
+        return self._legal.copy()
+
+    def _observe(self) -> dict:
+        obs = {"current_player": self._current_player.copy(),
+               "legal_mask": masks_to_vectors(self._legal),
+               "scores": self._scores.copy()}
+        if not self._full_observations:
+            return obs
+        round_masks = np.where(self._round_cards >= 0,
+                               _ONE << np.maximum(self._round_cards, 0).astype(np.uint64),
+                               np.uint64(0))
+        # (N, seat, row) masks, seats ordered from the current player
+        masks = np.stack([self._hands, self._collected, self._played, round_masks], axis=-1)
+        seats = (self._current_player[:, None] + np.arange(N_PLAYERS)) % N_PLAYERS
+        masks = masks[self._rows[:, None], seats]
+        # Masks in the layout of the observation rows, the declaration
+        # rows stay empty, so that one conversion builds both arrays
+        self._obs_masks[:, 0, :4] = masks[:, 0]
+        self._obs_masks[:, 1:, :3] = masks[:, 1:, 1:]
+        vectors = _unpack_rows(self._obs_masks)
+        agent_info = vectors[:, 0]
+        players_info = vectors[:, 1:]
+        obs.update({"agent_info": agent_info,
+                    "players_info": players_info,
+                    "history": self._history.copy(),
+                    "first_player_indices": self._first_player_indices.copy()})
+        return obs
+
+    def render(self) -> Any:
+        pass
+
+    def close(self) -> None:
+        pass
+
+# Masks used by greedy_actions
+_PIG, _SHEEP, _DOUBLER = np.uint64(PIG.mask), np.uint64(SHEEP.mask), np.uint64(DOUBLER.mask)
+_PIGPEN = np.uint64(PIGPEN.mask)
+_KING_OF_SPADES, _ACE_OF_SPADES = np.uint64(PIGPEN[0].mask), np.uint64(PIGPEN[1].mask)
+_SAFE_SPADES, _SAFE_CLUBS = np.uint64(SAFESPADE.mask), np.uint64(SAFECLUB.mask)
+_SAFE_DIAMONDS = np.uint64(SAFEDIAMOND.mask)
+_HEARTS, _CLUBS = np.uint64(SUIT_MASKS[SUIT_INDEX["heart"]]), np.uint64(SUIT_MASKS[SUIT_INDEX["club"]])
+_SUIT_MASKS = np.array(SUIT_MASKS, dtype=np.uint64)
+
+def _highest_cards(masks : np.ndarray) -> np.ndarray:
+    """Value of the highest card of each mask, -1 for empty masks."""
+    # Masks below 2^53 are exact as doubles, so the exponent is exact too
+    return np.frexp(masks.astype(np.float64))[1].astype(np.int64) - 1
+
+def _random_cards(masks : np.ndarray, rng : np.random.Generator) -> np.ndarray:
+    """A uniformly drawn card of each non-empty mask."""
+    picks = (rng.random(len(masks)) * _popcount(masks)).astype(np.uint8)
+    # Binary search of the lowest card with more than `picks` cards of
+    # the mask at or below it
+    low = np.zeros(len(masks), dtype=np.int64)
+    high = np.full(len(masks), SUITE_SIZE - 1, dtype=np.int64)
+    while (low < high).any():
+        middle = (low + high) // 2
+        below = _popcount(masks & ((_ONE << (middle + 1).astype(np.uint64)) - _ONE))
+        is_left = below > picks
+        high = np.where(is_left, middle, high)
+        low = np.where(is_left, low, middle + 1)
+    return low
+
+def greedy_actions(env : VectorGongzhu, rng : np.random.Generator,
+                   epsilon : float = 0.0) -> np.ndarray:
+    """
+    The moves of GreedyPolicy in every game of `env`, as array operations.
+    The player to move avoids taking the pig, the doubler and hearts,
+    dumps them on other players when void in the lead suit, and tries
+    to take the sheep.
+
+    :param epsilon: Probability of a random legal move instead.
+    :return: (N,) card values.
+    """
+    legal = env._legal
+    position = env._n_played % N_PLAYERS
+    choice = np.full(env.num_envs, -1, dtype=np.int64)
+
+    # Conditions are tried in order, the first one that holds picks the move
+    def choose(condition, cards):
+        nonlocal choice
+        choice = np.where((choice < 0) & condition, cards, choice)
+
+    def has(card):
+        return (legal & card) != 0
+
+    choose(rng.random(env.num_envs) < epsilon, _random_cards(legal, rng))
+    # A single legal move
+    choose((legal & (legal - _ONE)) == 0, _highest_cards(legal))
+    if position == 0:
+        # Lead the highest spade below the pig, unless holding the pig
+        safe = legal & _SAFE_SPADES
+        choose(~has(_PIG) & (safe != 0), _highest_cards(safe))
+        # Draw the sheep out with any other card
+        choose(has(_SHEEP), _random_cards(legal & ~_SHEEP, rng))
+    else:
+        lead_suit = env._lead_suit
+        round_cards = env._round_cards
+        largest = np.where(round_cards // len(RANKS) == lead_suit[:, None], round_cards, -1).max(axis=1)
+        is_last = position == N_PLAYERS - 1
+        follows = (legal & _SUIT_MASKS[lead_suit]) != 0
+        spades = follows & (lead_suit == SUIT_INDEX["spade"])
+        clubs = follows & (lead_suit == SUIT_INDEX["club"])
+        diamonds = follows & (lead_suit == SUIT_INDEX["diamond"])
+        hearts = follows & (lead_suit == SUIT_INDEX["heart"])
+        largest_bit = _ONE << np.maximum(largest, 0).astype(np.uint64)
+
+        # Give the pig to a king or ace of spades, else play high
+        choose(spades & has(_PIG) & ((largest_bit & _PIGPEN) != 0), PIG.value)
+        choose(spades & (has(_PIG) | is_last), _highest_cards(legal & ~_PIG))
+        choose(spades, _highest_cards(legal & _SAFE_SPADES))
+        # Give the doubler to a higher club, else play high
+        choose(clubs & has(_DOUBLER) & (largest > DOUBLER.value), DOUBLER.value)
+        choose(clubs & (has(_DOUBLER) | is_last), _highest_cards(legal & ~_DOUBLER))
+        choose(clubs, _highest_cards(legal & _SAFE_CLUBS))
+        # Take the sheep as the last player, else keep it
+        choose(diamonds & has(_SHEEP) & is_last & (largest < SHEEP.value), SHEEP.value)
+        choose(diamonds & has(_SHEEP), _random_cards(legal & ~_SHEEP, rng))
+        choose(diamonds & (largest < SHEEP.value), _highest_cards(legal))
+        choose(diamonds, _highest_cards(legal & _SAFE_DIAMONDS))
+        # Play the highest heart that does not take the round
+        choose(hearts, _highest_cards(legal & (largest_bit - _ONE)))
+        # Void in the lead suit: dump the worst cards
+        void = ~follows
+        choose(void & has(_PIG), PIG.value)
+        choose(void & has(_DOUBLER), DOUBLER.value)
+        choose(void, _highest_cards(legal & _HEARTS))
+        choose(void & has(_KING_OF_SPADES), PIGPEN[0].value)
+        choose(void & has(_ACE_OF_SPADES), PIGPEN[1].value)
+        choose(void, _highest_cards(legal & _CLUBS))
+    choose(True, _random_cards(legal, rng))
+    return choice
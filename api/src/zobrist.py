@@ -0,0 +1,65 @@
+# Zobrist keys of Gongzhu positions
+# The hash of a position is the XOR of the keys of its features: where
+# each card is (hand, played and collected per seat, current round),
+# the leader of the round, the effect multipliers, the phase, the closed
+# declarations and the suits already led.
+# Keys are drawn from a fixed seed so hashes are stable across runs.
+import numpy as np
+from typing import List
+from card import SUITE_SIZE
+
+N_SEATS = 4
+
+_rng = np.random.default_rng(0x60E62)
+
+def _keys(*shape) -> List:
+    return _rng.integers(0, 1 << 64, size=shape, dtype=np.uint64, endpoint=False).tolist()
+
+# Indexed by [seat][card value]
+HAND_KEYS = _keys(N_SEATS, SUITE_SIZE)
+PLAYED_KEYS = _keys(N_SEATS, SUITE_SIZE)
+COLLECTED_KEYS = _keys(N_SEATS, SUITE_SIZE)
+# Cards of the round in progress, indexed by card value
+ROUND_KEYS = _keys(SUITE_SIZE)
+LEADER_KEYS = _keys(N_SEATS)
+# Indexed by [effect][level], for the multipliers of (pig, sheep, doubler, blood)
+# Level 0 (no declaration) has no key, so undeclared games only hash cards
+EFFECT_KEYS = [[0, *keys] for keys in _keys(4, 2)]
+_EFFECT_LEVELS = {1.0: 0, 2.0: 1, 4.0: 2}
+DECLARATION_PHASE_KEY = _keys(1)[0]
+# Suits of which a round was completed, which lifts the block on openly
+# declared cards
+LED_SUIT_KEYS = _keys(4)
+# Closed declarations and those revealed by being played, indexed by
+# card value. Until it is revealed, a closed declaration leaves the
+# effects as if the card was not declared
+CLOSED_DECLARED_KEYS = _keys(SUITE_SIZE)
+REVEALED_KEYS = _keys(SUITE_SIZE)
+
+def mask_key(keys : List[int], mask : int) -> int:
+    """XOR of the keys of the cards in a mask."""
+    key = 0
+    while mask:
+        low = mask & -mask
+        key ^= keys[low.bit_length() - 1]
+        mask ^= low
+    return key
+
+def declarations_key(closed_declared : int, revealed : int) -> int:
+    """Key of the closed declarations and of those revealed, as card masks."""
+    return mask_key(CLOSED_DECLARED_KEYS, closed_declared) ^ mask_key(REVEALED_KEYS, revealed)
+
+def led_suits_key(led_suits : int) -> int:
+    """Key of the suits already led, as a mask of suit indices."""
+    return mask_key(LED_SUIT_KEYS, led_suits)
+
+def effects_key(effects) -> int:
+    """Key of the effect multipliers (pig, sheep, doubler, blood)."""
+    key = 0
+    for keys, effect in zip(EFFECT_KEYS, effects):
+        key ^= keys[_EFFECT_LEVELS[effect]]
+    return key
+
+def leader_key(index : int) -> int:
+    """Key of the leader of the round, -1 when the game is over."""
+    return LEADER_KEYS[index] if index >= 0 else 0
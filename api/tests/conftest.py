@@ -0,0 +1,5 @@
+# The modules of src import each other by their plain names
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
@@ -0,0 +1,62 @@
+from functools import partial
+import random
+import numpy as np
+from async_env import AsyncGongzhu, OBSERVATION_SPECS, _shared_arrays, _write_observation, random_players
+from card import CARDS
+from env import Gongzhu
+
+def random_legal_actions(observations, rng):
+    return [rng.choice(np.flatnonzero(legal_mask)) for legal_mask in observations["legal_mask"]]
+
+def test_fast_forward_keeps_final_scores():
+    envs = AsyncGongzhu([partial(Gongzhu, fast_forward=True)] * 2)
+    try:
+        rng = random.Random(0)
+        observations, _ = envs.reset(seed=0)
+        truncated_count = 0
+        while truncated_count < 10:
+            observations, rewards, terminations, truncations, infos = \
+                envs.step(random_legal_actions(observations, rng))
+            for reward, truncated, info in zip(rewards, truncations, infos["infos"]):
+                if truncated:
+                    truncated_count += 1
+                    # The settled scores, not those before the last round
+                    scores = info["final_scores"]
+                    assert reward == scores[0] + scores[2] - scores[1] - scores[3]
+    finally:
+        envs.close()
+
+def written_observation(env):
+    shared_memory = {key: bytearray(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                     for key, (shape, dtype) in OBSERVATION_SPECS.items()}
+    arrays = _shared_arrays(shared_memory, 1)
+    _write_observation(env, arrays, 0)
+    return {key: array[0] for key, array in arrays.items()}
+
+def test_write_observation_without_to_state_layout():
+    rng = random.Random(0)
+    for env in (Gongzhu(headless=True), Gongzhu(flat_observations=True)):
+        env.reset(ai_players=random_players(), seed=0)
+        while not env.is_end_episode():
+            observation = written_observation(env)
+            state = env.to_state()
+            assert np.array_equal(observation["agent_info"], state["agent_info"])
+            assert np.array_equal(observation["players_info"], state["players_info"])
+            history = [card.value for card in state["history"]]
+            assert observation["history"][:len(history)].tolist() == history
+            assert (observation["history"][len(history):] == -1).all()
+            rounds = state["first_player_indices"]
+            assert observation["first_player_indices"][:len(rounds)].tolist() == rounds
+            assert np.array_equal(observation["scores"], state["scores"])
+            env.step(CARDS[rng.choice(np.flatnonzero(observation["legal_mask"]))])
+
+def test_headless_workers():
+    envs = AsyncGongzhu([partial(Gongzhu, headless=True)] * 2)
+    try:
+        rng = random.Random(0)
+        observations, _ = envs.reset(seed=0)
+        for _ in range(40):
+            observations, _, _, _, _ = envs.step(random_legal_actions(observations, rng))
+            assert (observations["legal_mask"].sum(axis=1) > 0).all()
+    finally:
+        envs.close()
@@ -0,0 +1,14 @@
+from env import Gongzhu
+
+def test_reset_without_players():
+    env = Gongzhu()
+    env.reset(seed=0)
+    players = [env.get_player_by_index(index) for index in range(4)]
+    policies = [player.policy for player in players]
+    while not env.is_end_episode():
+        env.step(env.agent_legal_moves().get_one_random_card())
+    # The seats and their policies are kept for the next game
+    env.reset()
+    assert all(env.get_player_by_index(index) is player for index, player in enumerate(players))
+    assert all(player.policy is policy for player, policy in zip(players, policies))
+    assert sum(len(player.get_hand()) for player in players) + len(env.get_played_cards_this_round()) == 52
@@ -0,0 +1,24 @@
+import pytest
+from env import Gongzhu
+from events import CardPlayedEvent
+from player import Player
+from policy import RandomPolicy
+
+def random_players():
+    return [Player(policy=RandomPolicy()) for _ in range(4)]
+
+def test_listeners_survive_a_failed_apply_move():
+    env = Gongzhu()
+    env.reset(ai_players=random_players(), seed=0)
+    events = []
+    env.subscribe(CardPlayedEvent, events.append)
+    # A card of another player
+    other_hand = env.get_player_by_index((env.get_current_player_index() + 1) % 4).get_hand()
+    card = next(iter(other_hand))
+    with pytest.raises(ValueError):
+        env.apply_move(card)
+
+    env.reset(ai_players=random_players(), seed=1)
+    events.clear()
+    env.step(env.agent_legal_moves().get_one_random_card())
+    assert events and events[0].seat == 0
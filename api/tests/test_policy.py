@@ -0,0 +1,19 @@
+import random
+import torch
+from env import Gongzhu
+from player import Player
+from policy import RandomPolicy, DMC, MFE
+
+def test_models_read_buffers_as_states():
+    torch.manual_seed(0)
+    random.seed(0)
+    policies = [DMC(), MFE()]
+    env = Gongzhu()
+    env.reset(ai_players=[Player(policy=RandomPolicy()) for _ in range(4)], seed=0)
+    with torch.no_grad():
+        while not env.is_end_episode():
+            for policy in policies:
+                expected = policy.forward(env.to_state())
+                assert torch.equal(policy.forward(env.to_buffers()), expected)
+                assert torch.equal(policy.forward(env.to_flat_state()), expected)
+            env.step(env.agent_legal_moves().get_one_random_card())